@@ -1,16 +1,29 @@
+import hashlib
+import hmac
 import json
 import os
+import queue
+import random
 import re
+import secrets
+import threading
+import orjson
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
 import pandas as pd
 import requests
-from flask import Flask, request, jsonify
+from requests.adapters import HTTPAdapter
+from flask import Flask, request, Response
 from flask_cors import CORS
 from dotenv import load_dotenv
 import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+from types import MappingProxyType
 from n8n_vendor_service import search_vendors_n8n, get_all_vendors_n8n, search_vendors_db, USE_DB_FALLBACK
 
 load_dotenv()
@@ -20,55 +33,273 @@ CORS(app, resources={r"/*": {"origins": ["http://localhost:5173", "http://localh
 
 DB_NAME = "ctai.db"
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+# Shared keep-alive session so repeat Groq calls skip the TCP/TLS handshake to api.groq.com
+_GROQ_SESSION = requests.Session()
+_GROQ_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+_SCHEMA = """
+    -- Users table
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        company TEXT,
+        project_type TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Conversations table
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+
+    -- Messages table
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conversation_id INTEGER NOT NULL,
+        sender TEXT NOT NULL,
+        text TEXT NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+    );
+
+    -- users.email already gets an automatic unique index from its UNIQUE constraint.
+    -- Composite indexes serve both the WHERE and the ORDER BY of the history queries;
+    -- they supersede the earlier single-column ones.
+    DROP INDEX IF EXISTS idx_conv_user;
+    DROP INDEX IF EXISTS idx_msg_conv;
+    CREATE INDEX IF NOT EXISTS idx_conv_user_created ON conversations(user_id, created_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_msg_conv_ts ON messages(conversation_id, timestamp);
+"""
+
+# Hot-path statements. sqlite3 keeps prepared statements in a per-connection
+# cache keyed by SQL text, so reusing these exact strings skips re-preparing them.
+SQL_SELECT_ALL_VENDORS = 'SELECT * FROM vendors'
+SQL_SELECT_VENDOR = 'SELECT * FROM vendors WHERE id = ?'
+SQL_INSERT_USER = 'INSERT INTO users (name, email, password_hash, company, project_type) VALUES (?, ?, ?, ?, ?)'
+SQL_SELECT_USER = 'SELECT id, name, email, company, password_hash FROM users WHERE email = ? LIMIT 1'
+# History reads build the JSON array inside SQLite; the ordered subquery fixes element order
+SQL_SELECT_CONVERSATIONS_JSON = (
+    "SELECT json_group_array(json_object('id', id, 'user_id', user_id, 'title', title, 'created_at', created_at)) "
+    "FROM (SELECT * FROM conversations WHERE user_id = ? ORDER BY created_at DESC)"
+)
+SQL_INSERT_CONVERSATION = 'INSERT INTO conversations (user_id, title) VALUES (?, ?)'
+SQL_SELECT_MESSAGES_JSON = (
+    "SELECT json_group_array(json_object('id', id, 'conversation_id', conversation_id, 'sender', sender, "
+    "'text', text, 'timestamp', timestamp)) "
+    "FROM (SELECT * FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC)"
+)
+SQL_INSERT_MESSAGE = 'INSERT INTO messages (conversation_id, sender, text) VALUES (?, ?, ?)'
+
+def jsonify_fast(obj):
+    """Serialize a response body with orjson instead of Flask's stdlib-json jsonify"""
+    return app.response_class(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), mimetype='application/json')
+
+def _extract_json(text: str):
+    """Return the first balanced {...} object in text, skipping braces inside strings"""
+    start = text.find('{')
+    if start < 0:
+        return None
+    depth = 0
+    in_str = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if escaped:
+            escaped = False
+        elif ch == '\\':
+            escaped = in_str
+        elif ch == '"':
+            in_str = not in_str
+        elif in_str:
+            continue
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+# WAL mode is persistent in the database file, so it only has to be set once per process
+_wal_enabled = False
+OPTIMIZE_INTERVAL = 600  # seconds between PRAGMA optimize runs
+_last_optimize = 0.0
+_optimize_lock = threading.Lock()
+STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection (sqlite3 default is 128)
+
+def get_db_connection(readonly: bool = False):
+    global _wal_enabled
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    if not _wal_enabled:
+        conn.execute("PRAGMA journal_mode=WAL")
+        _wal_enabled = True
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-40000")
+    conn.execute("PRAGMA cache_spill=OFF")
+    conn.execute("PRAGMA busy_timeout=5000")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
     return conn
 
+def _maybe_optimize(conn):
+    """PRAGMA optimize at most every OPTIMIZE_INTERVAL seconds, on a writer being handed back.
+    Pooled connections never close, so this stands in for optimize-on-close: by now the
+    connection has the query history optimize works from, and it can write the statistics."""
+    global _last_optimize
+    now = time.time()
+    with _optimize_lock:
+        if now - _last_optimize <= OPTIMIZE_INTERVAL:
+            return
+        _last_optimize = now
+    try:
+        conn.execute("PRAGMA optimize")
+    except sqlite3.Error as e:
+        print(f"PRAGMA optimize failed: {e}")
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections, opened lazily up to `size`"""
+
+    def __init__(self, size: int, readonly: bool = False):
+        self.size = size
+        self.readonly = readonly
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return get_db_connection(self.readonly)
+        return self._idle.get()
+
+    def put(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+# One writer (SQLite serializes writes anyway) plus a set of query_only readers
+_read_pool = ConnectionPool(int(os.getenv("DB_POOL_READERS", "8")), readonly=True)
+_write_pool = ConnectionPool(int(os.getenv("DB_POOL_WRITERS", "1")))
+
+@contextmanager
+def db_conn(readonly: bool = False):
+    pool = _read_pool if readonly else _write_pool
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        if not readonly and not conn.in_transaction:
+            _maybe_optimize(conn)
+        pool.put(conn)
+
 def init_db():
     conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            company TEXT,
-            project_type TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Conversations table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            title TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # Messages table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            conversation_id INTEGER NOT NULL,
-            sender TEXT NOT NULL,
-            text TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
-        )
-    ''')
-    
+    conn.executescript(_SCHEMA)
     conn.commit()
     conn.close()
     print("Database initialized.")
 
+_get_total_cost = itemgetter('total_cost')
+
+# Fallback material recommendations when AI is unavailable. Read-only: callers only .get() from them.
+_FALLBACK_DATACENTER = MappingProxyType({
+    "project_analysis": "Data center/power infrastructure project requiring electrical and cooling systems",
+    "recommended_materials": (
+        {"category": "transformer", "search_query": "power transformer", "priority": "high", "reason": "Power distribution"},
+        {"category": "ht_switchgear", "search_query": "HT switchgear panel", "priority": "high", "reason": "High voltage switching"},
+        {"category": "lv_panel", "search_query": "LV panel board", "priority": "high", "reason": "Low voltage distribution"},
+        {"category": "diesel_generator", "search_query": "diesel generator DG set", "priority": "high", "reason": "Backup power"},
+        {"category": "ups_battery", "search_query": "UPS battery system", "priority": "high", "reason": "Uninterrupted power"},
+        {"category": "cables", "search_query": "power cable armoured", "priority": "high", "reason": "Electrical wiring"},
+        {"category": "chillers", "search_query": "water cooled chiller", "priority": "high", "reason": "Cooling system"},
+        {"category": "cooling_tower", "search_query": "cooling tower FRP", "priority": "high", "reason": "Heat rejection"},
+        {"category": "pumps", "search_query": "chilled water pump", "priority": "medium", "reason": "Water circulation"},
+        {"category": "ducting", "search_query": "HVAC ducting", "priority": "medium", "reason": "Air distribution"},
+        {"category": "raised_flooring", "search_query": "raised access floor", "priority": "medium", "reason": "Cable management"},
+        {"category": "fire_detection", "search_query": "fire alarm system", "priority": "high", "reason": "Fire safety"},
+        {"category": "clean_agent", "search_query": "clean agent fire suppression", "priority": "high", "reason": "Server room protection"},
+        {"category": "structured_cabling", "search_query": "structured cabling cat6", "priority": "medium", "reason": "Network infrastructure"},
+        {"category": "server_racks", "search_query": "server rack cabinet", "priority": "medium", "reason": "Equipment housing"},
+    )
+})
+
+_FALLBACK_STANDARD = MappingProxyType({
+    "project_analysis": "Commercial/residential construction project",
+    "recommended_materials": (
+        {"category": "cement", "search_query": "OPC cement 53 grade", "priority": "high", "reason": "Structural work"},
+        {"category": "concrete", "search_query": "ready mix concrete", "priority": "high", "reason": "Foundation and structure"},
+        {"category": "aggregate", "search_query": "construction aggregate", "priority": "high", "reason": "Concrete mix"},
+        {"category": "tiles", "search_query": "vitrified floor tiles", "priority": "medium", "reason": "Flooring"},
+        {"category": "windows", "search_query": "aluminium windows", "priority": "medium", "reason": "Facade"},
+        {"category": "false_ceiling", "search_query": "gypsum false ceiling", "priority": "medium", "reason": "Interior finish"},
+        {"category": "cables", "search_query": "electrical wire cable", "priority": "high", "reason": "Electrical wiring"},
+        {"category": "sanitary_fixtures", "search_query": "sanitary fittings", "priority": "medium", "reason": "Plumbing"},
+    )
+})
+
+# Constant parts of the AI analysis prompt; only the project fields vary per request
+_ANALYSIS_SYSTEM_PROMPT = """You are an expert construction procurement analyst. 
+Analyze the project requirements and return a JSON response with required materials.
+Only use materials from the available categories provided.
+Be practical and specific based on project type (data center, commercial, industrial, residential)."""
+
+_ANALYSIS_PROMPT_TMPL = """Project Query: {query}
+
+Project Details:
+- Built Area: {area:,} sqft
+- Project Type: {ptype}
+- Power Capacity: {power} MW
+- Budget: {budget} Crores
+
+Available Material Categories:
+"""
+
+_ANALYSIS_PROMPT_TAIL = """
+
+Based on this project (appears to be a data center/power project given the MW specification), 
+return a JSON object with the following structure:
+{
+    "project_analysis": "Brief analysis of what this project needs",
+    "recommended_materials": [
+        {
+            "category": "category_name from available list",
+            "search_query": "specific search term for finding products",
+            "priority": "high/medium/low",
+            "reason": "why this material is needed"
+        }
+    ]
+}
+
+For a 25MW data center project, focus on:
+- Electrical systems (transformers, HT switchgear, cables, UPS, generators)
+- Cooling systems (chillers, cooling towers, pumps, ducting)
+- Building materials (concrete, raised flooring, false ceiling)
+- Fire safety (fire detection, sprinkler, clean agent)
+- IT infrastructure (structured cabling, server racks)
+
+Return ONLY the JSON object, no other text."""
+
+def _get_inventory_status():
+    """Generate mock inventory data for a material entry"""
+    status = random.choice(['In Stock', 'Low Stock', 'On Order'])
+    stock = f"{random.randint(50, 5000)}"
+    lead = f"{random.randint(2, 14)} Days"
+    sku = f"SKU-{random.choice(['IND', 'BOM', 'DEL'])}-{random.randint(100, 999)}"
+    return status, stock, lead, sku
+
 class ConstructionProcurementSystem:
     def __init__(self):
         self.groq_api_key = os.getenv("GROQ_API_KEY")
@@ -128,8 +359,9 @@ class ConstructionProcurementSystem:
             "grout": [],
             "acoustic_partition": []
         }
+        self._analysis_prompt_tail = json.dumps(list(self.material_categories.keys()), indent=2) + _ANALYSIS_PROMPT_TAIL
     
-    def call_groq_api(self, prompt: str, system_prompt: str = "") -> str:
+    def call_groq_api(self, prompt: str, system_prompt: str = "", json_mode: bool = False) -> str:
         """Call Groq API for AI analysis"""
         if not self.groq_api_key:
             return None
@@ -151,8 +383,10 @@ class ConstructionProcurementSystem:
                 "temperature": 0.3,
                 "max_tokens": 2000
             }
+            if json_mode:
+                data["response_format"] = {"type": "json_object"}
             
-            response = requests.post(
+            response = _GROQ_SESSION.post(
                 "https://api.groq.com/openai/v1/chat/completions",
                 headers=headers,
                 json=data,
@@ -160,7 +394,7 @@ class ConstructionProcurementSystem:
             )
             
             if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
+                return orjson.loads(response.content)["choices"][0]["message"]["content"]
             else:
                 print(f"Groq API error: {response.status_code} - {response.text}")
                 return None
@@ -172,57 +406,23 @@ class ConstructionProcurementSystem:
     def analyze_project_with_ai(self, query: str, project_details: Dict) -> Dict:
         """Use AI to analyze project and determine required materials"""
         
-        # Get all available material categories
-        available_categories = list(self.material_categories.keys())
-        
-        system_prompt = """You are an expert construction procurement analyst. 
-Analyze the project requirements and return a JSON response with required materials.
-Only use materials from the available categories provided.
-Be practical and specific based on project type (data center, commercial, industrial, residential)."""
-
-        prompt = f"""Project Query: {query}
-
-Project Details:
-- Built Area: {project_details.get('built_area_sqft', 0):,} sqft
-- Project Type: {project_details.get('project_type', 'commercial')}
-- Power Capacity: {project_details.get('power_capacity_mw', 'N/A')} MW
-- Budget: {project_details.get('project_volume_cr', 'N/A')} Crores
-
-Available Material Categories:
-{json.dumps(available_categories, indent=2)}
-
-Based on this project (appears to be a data center/power project given the MW specification), 
-return a JSON object with the following structure:
-{{
-    "project_analysis": "Brief analysis of what this project needs",
-    "recommended_materials": [
-        {{
-            "category": "category_name from available list",
-            "search_query": "specific search term for finding products",
-            "priority": "high/medium/low",
-            "reason": "why this material is needed"
-        }}
-    ]
-}}
-
-For a 25MW data center project, focus on:
-- Electrical systems (transformers, HT switchgear, cables, UPS, generators)
-- Cooling systems (chillers, cooling towers, pumps, ducting)
-- Building materials (concrete, raised flooring, false ceiling)
-- Fire safety (fire detection, sprinkler, clean agent)
-- IT infrastructure (structured cabling, server racks)
+        prompt = _ANALYSIS_PROMPT_TMPL.format(
+            query=query,
+            area=project_details.get('built_area_sqft', 0),
+            ptype=project_details.get('project_type', 'commercial'),
+            power=project_details.get('power_capacity_mw', 'N/A'),
+            budget=project_details.get('project_volume_cr', 'N/A'),
+        ) + self._analysis_prompt_tail
 
-Return ONLY the JSON object, no other text."""
-
-        ai_response = self.call_groq_api(prompt, system_prompt)
+        ai_response = self.call_groq_api(prompt, _ANALYSIS_SYSTEM_PROMPT, json_mode=True)
         
         if ai_response:
             try:
                 # Extract JSON from response
-                json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                if json_match:
-                    return json.loads(json_match.group())
-            except json.JSONDecodeError:
+                json_text = _extract_json(ai_response)
+                if json_text:
+                    return orjson.loads(json_text)
+            except orjson.JSONDecodeError:
                 print("Failed to parse AI response as JSON")
         
         # Fallback: Return default materials based on project type
@@ -232,45 +432,10 @@ Return ONLY the JSON object, no other text."""
         """Fallback material recommendations when AI is unavailable"""
         power_mw = project_details.get('power_capacity_mw')
         
-        # If it's a power/data center project
+        # Power/data center project vs standard construction project
         if power_mw and power_mw > 0:
-            return {
-                "project_analysis": "Data center/power infrastructure project requiring electrical and cooling systems",
-                "recommended_materials": [
-                    {"category": "transformer", "search_query": "power transformer", "priority": "high", "reason": "Power distribution"},
-                    {"category": "ht_switchgear", "search_query": "HT switchgear panel", "priority": "high", "reason": "High voltage switching"},
-                    {"category": "lv_panel", "search_query": "LV panel board", "priority": "high", "reason": "Low voltage distribution"},
-                    {"category": "diesel_generator", "search_query": "diesel generator DG set", "priority": "high", "reason": "Backup power"},
-                    {"category": "ups_battery", "search_query": "UPS battery system", "priority": "high", "reason": "Uninterrupted power"},
-                    {"category": "cables", "search_query": "power cable armoured", "priority": "high", "reason": "Electrical wiring"},
-                    {"category": "chillers", "search_query": "water cooled chiller", "priority": "high", "reason": "Cooling system"},
-                    {"category": "cooling_tower", "search_query": "cooling tower FRP", "priority": "high", "reason": "Heat rejection"},
-                    {"category": "pumps", "search_query": "chilled water pump", "priority": "medium", "reason": "Water circulation"},
-                    {"category": "ducting", "search_query": "HVAC ducting", "priority": "medium", "reason": "Air distribution"},
-                    {"category": "raised_flooring", "search_query": "raised access floor", "priority": "medium", "reason": "Cable management"},
-                    {"category": "fire_detection", "search_query": "fire alarm system", "priority": "high", "reason": "Fire safety"},
-                    {"category": "clean_agent", "search_query": "clean agent fire suppression", "priority": "high", "reason": "Server room protection"},
-                    {"category": "structured_cabling", "search_query": "structured cabling cat6", "priority": "medium", "reason": "Network infrastructure"},
-                    {"category": "server_racks", "search_query": "server rack cabinet", "priority": "medium", "reason": "Equipment housing"},
-                ]
-            }
-        else:
-            # Standard construction project
-            return {
-                "project_analysis": "Commercial/residential construction project",
-                "recommended_materials": [
-                    {"category": "cement", "search_query": "OPC cement 53 grade", "priority": "high", "reason": "Structural work"},
-                    {"category": "concrete", "search_query": "ready mix concrete", "priority": "high", "reason": "Foundation and structure"},
-                    {"category": "aggregate", "search_query": "construction aggregate", "priority": "high", "reason": "Concrete mix"},
-                    {"category": "tiles", "search_query": "vitrified floor tiles", "priority": "medium", "reason": "Flooring"},
-                    {"category": "windows", "search_query": "aluminium windows", "priority": "medium", "reason": "Facade"},
-                    {"category": "false_ceiling", "search_query": "gypsum false ceiling", "priority": "medium", "reason": "Interior finish"},
-                    {"category": "cables", "search_query": "electrical wire cable", "priority": "high", "reason": "Electrical wiring"},
-                    {"category": "sanitary_fixtures", "search_query": "sanitary fittings", "priority": "medium", "reason": "Plumbing"},
-                ]
-            }
-    
-
+            return _FALLBACK_DATACENTER
+        return _FALLBACK_STANDARD
     
     def estimate_materials_fallback(self, built_area_sqft: float, project_type: str = "residential") -> List[Dict]:
         """Fallback: Estimate material requirements based on built area using hardcoded formulas"""
@@ -301,7 +466,7 @@ Return ONLY the JSON object, no other text."""
     
     def calculate_budget_breakdown(self, materials: List[Dict], built_area_sqft: float, project_volume_cr: float = None) -> Dict:
         """Calculate detailed budget breakdown with Indian context (GST)"""
-        material_cost = sum(m['total_cost'] for m in materials)
+        material_cost = sum(map(_get_total_cost, materials))
         
         # Standard construction cost components (as % of material cost) for Indian market
         labor_cost = material_cost * 0.35  # Labor is relatively cheaper
@@ -493,15 +658,6 @@ Return ONLY the JSON object, no other text."""
         
         recommended_materials = ai_analysis.get("recommended_materials", [])
         
-        # Helper to generate mock inventory data
-        import random
-        def get_inventory_status():
-            status = random.choice(['In Stock', 'Low Stock', 'On Order'])
-            stock = f"{random.randint(50, 5000)}"
-            lead = f"{random.randint(2, 14)} Days"
-            sku = f"SKU-{random.choice(['IND', 'BOM', 'DEL'])}-{random.randint(100, 999)}"
-            return status, stock, lead, sku
-
         for material_info in recommended_materials:
             category = material_info.get("category", "")
             search_query = material_info.get("search_query", category)
@@ -513,7 +669,7 @@ Return ONLY the JSON object, no other text."""
                 # Fallback to DB if n8n returns nothing
                 vendors = search_vendors_db(search_query, location, k=3)
             
-            status, stock, lead, sku = get_inventory_status()
+            status, stock, lead, sku = _get_inventory_status()
             
             if vendors:
                 vendor_mapping[category.replace("_", " ").title()] = vendors
@@ -542,7 +698,7 @@ Return ONLY the JSON object, no other text."""
             materials_fallback = self.estimate_materials_fallback(built_area, project_type)
             for material in materials_fallback:
                 # Add inventory fields to fallback data
-                status, stock, lead, sku = get_inventory_status()
+                status, stock, lead, sku = _get_inventory_status()
                 material.update({
                     "stock_level": f"{stock}",
                     "stock_status": status,
@@ -577,6 +733,20 @@ Return ONLY the JSON object, no other text."""
 # Global instance
 system = None
 
+VENDOR_CACHE_TTL = 30  # seconds
+
+@lru_cache(maxsize=8)
+def _vendors_by_id(bucket: int) -> Dict[int, Dict]:
+    """Index the n8n vendor list by id; `bucket` rolls every VENDOR_CACHE_TTL seconds to expire entries"""
+    vendors = {}
+    for v in get_all_vendors_n8n():
+        if 'id' in v:
+            vendors.setdefault(v['id'], v)  # first duplicate wins, as with a linear scan
+    if not vendors:
+        # A timeout or n8n error also comes back empty; raising keeps lru_cache from storing it
+        raise LookupError("n8n returned no vendors")
+    return vendors
+
 def init_system():
     global system
     if system is None:
@@ -596,13 +766,14 @@ def procurement():
     query = data.get('query', '')
     
     if not query:
-        return jsonify({"error": "No query provided"}), 400
+        return jsonify_fast({"error": "No query provided"}), 400
     
     try:
         report = system.generate_procurement_report(query)
-        return jsonify(report)
+        # Serialized whole inside the try, so a value orjson can't encode still becomes a 500
+        return jsonify_fast(report)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify_fast({"error": str(e)}), 500
 
 @app.route('/search_vendors', methods=['POST'])
 def search_vendors():
@@ -612,7 +783,7 @@ def search_vendors():
     location = data.get('location', '')
     
     if not material:
-        return jsonify({"error": "Material not specified"}), 400
+        return jsonify_fast({"error": "Material not specified"}), 400
     
     try:
         # Primary: use n8n webhook API
@@ -622,9 +793,9 @@ def search_vendors():
         if not vendors and USE_DB_FALLBACK:
             vendors = search_vendors_db(material, location, k=10)
         
-        return jsonify({"vendors": vendors})
+        return jsonify_fast({"vendors": vendors})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify_fast({"error": str(e)}), 500
 
 @app.route('/vendors', methods=['GET'])
 def get_vendors():
@@ -636,47 +807,75 @@ def get_vendors():
         
         # Fallback to DB if n8n returns nothing and fallback is enabled
         if not vendors_list and USE_DB_FALLBACK:
-            conn = get_db_connection()
-            try:
-                vendors = conn.execute('SELECT * FROM vendors').fetchall()
+            with db_conn(readonly=True) as conn:
+                vendors = conn.execute(SQL_SELECT_ALL_VENDORS).fetchall()
                 vendors_list = [dict(v) for v in vendors]
-            finally:
-                conn.close()
         
-        return jsonify({"vendors": vendors_list})
+        return jsonify_fast({"vendors": vendors_list})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify_fast({"error": str(e)}), 500
 
 @app.route('/vendors/<int:vendor_id>', methods=['GET'])
 def get_vendor_details(vendor_id):
     """Get details for a specific vendor"""
     # Fetch all vendors from n8n and find by id
     try:
-        vendors = get_all_vendors_n8n()
-        vendor = next((v for v in vendors if v.get('id') == vendor_id), None)
+        try:
+            vendor = _vendors_by_id(int(time.time()) // VENDOR_CACHE_TTL).get(vendor_id)
+        except LookupError:
+            vendor = None
         
         if vendor:
-            return jsonify(vendor)
+            return jsonify_fast(vendor)
         
         # Fallback to DB if not found in n8n and fallback is enabled
         if USE_DB_FALLBACK:
-            conn = get_db_connection()
-            try:
-                vendor = conn.execute('SELECT * FROM vendors WHERE id = ?', (vendor_id,)).fetchone()
-                if vendor:
-                    return jsonify(dict(vendor))
-            finally:
-                conn.close()
+            with db_conn(readonly=True) as conn:
+                vendor = conn.execute(SQL_SELECT_VENDOR, (vendor_id,)).fetchone()
+            if vendor:
+                return jsonify_fast(dict(vendor))
         
-        return jsonify({"error": "Vendor not found"}), 404
+        return jsonify_fast({"error": "Vendor not found"}), 404
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify_fast({"error": str(e)}), 500
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({"status": "healthy", "mode": "n8n + DB fallback"})
+    return jsonify_fast({"status": "healthy", "mode": "n8n + DB fallback"})
 
 # Authentication Endpoints
+LOGIN_CACHE_TTL = 60  # seconds
+LOGIN_CACHE_SIZE = 1024
+_login_cache = OrderedDict()
+_login_cache_bucket = 0
+_login_cache_lock = threading.Lock()
+# Per-process key for the cache's password MACs; never stored, so the MACs can't be attacked offline
+_LOGIN_CACHE_SECRET = secrets.token_bytes(32)
+
+def _verify_password(password_hash: str, password: str) -> bool:
+    """check_password_hash behind a short-lived LRU so repeat logins skip the KDF.
+    Only successful checks are cached, keyed on the stored hash (a password change
+    invalidates it) and an HMAC of the attempt under a per-process random secret, so
+    neither the password nor a plain fast hash of it is held in the cache."""
+    global _login_cache_bucket
+    key = (password_hash, hmac.new(_LOGIN_CACHE_SECRET, password.encode(), hashlib.sha256).hexdigest())
+    bucket = int(time.time()) // LOGIN_CACHE_TTL
+    with _login_cache_lock:
+        if bucket != _login_cache_bucket:
+            _login_cache.clear()
+            _login_cache_bucket = bucket
+        if key in _login_cache:
+            _login_cache.move_to_end(key)
+            return True
+    
+    ok = check_password_hash(password_hash, password)
+    if ok:
+        with _login_cache_lock:
+            _login_cache[key] = True
+            if len(_login_cache) > LOGIN_CACHE_SIZE:
+                _login_cache.popitem(last=False)
+    return ok
+
 @app.route('/register', methods=['POST'])
 def register():
     data = request.json
@@ -687,24 +886,20 @@ def register():
     project_type = data.get('project_type')
     
     if not email or not password or not name:
-        return jsonify({"error": "Missing required fields"}), 400
+        return jsonify_fast({"error": "Missing required fields"}), 400
         
-    conn = get_db_connection()
-    c = conn.cursor()
-    
     try:
         password_hash = generate_password_hash(password)
-        c.execute('INSERT INTO users (name, email, password_hash, company, project_type) VALUES (?, ?, ?, ?, ?)',
-                  (name, email, password_hash, company, project_type))
-        conn.commit()
-        user_id = c.lastrowid
-        return jsonify({"message": "User registered successfully", "user_id": user_id}), 201
+        with db_conn() as conn:
+            c = conn.cursor()
+            c.execute(SQL_INSERT_USER, (name, email, password_hash, company, project_type))
+            conn.commit()
+            user_id = c.lastrowid
+        return jsonify_fast({"message": "User registered successfully", "user_id": user_id}), 201
     except sqlite3.IntegrityError:
-        return jsonify({"error": "Email already exists"}), 409
+        return jsonify_fast({"error": "Email already exists"}), 409
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+        return jsonify_fast({"error": str(e)}), 500
 
 @app.route('/login', methods=['POST'])
 def login():
@@ -712,12 +907,11 @@ def login():
     email = data.get('email')
     password = data.get('password')
     
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
-    conn.close()
+    with db_conn(readonly=True) as conn:
+        user = conn.execute(SQL_SELECT_USER, (email,)).fetchone()
     
-    if user and check_password_hash(user['password_hash'], password):
-        return jsonify({
+    if user and password and _verify_password(user['password_hash'], password):
+        return jsonify_fast({
             "message": "Login successful",
             "user": {
                 "id": user['id'],
@@ -727,54 +921,50 @@ def login():
             }
         }), 200
     else:
-        return jsonify({"error": "Invalid email or password"}), 401
+        return jsonify_fast({"error": "Invalid email or password"}), 401
 
 # Chat History Endpoints
 @app.route('/conversations', methods=['GET', 'POST'])
 def handle_conversations():
-    conn = get_db_connection()
-    
     if request.method == 'GET':
         user_id = request.args.get('user_id')
         if not user_id:
-            return jsonify({"error": "User ID required"}), 400
+            return jsonify_fast({"error": "User ID required"}), 400
             
-        conversations = conn.execute('SELECT * FROM conversations WHERE user_id = ? ORDER BY created_at DESC', (user_id,)).fetchall()
-        conn.close()
-        return jsonify([dict(c) for c in conversations])
+        with db_conn(readonly=True) as conn:
+            payload = conn.execute(SQL_SELECT_CONVERSATIONS_JSON, (user_id,)).fetchone()[0]
+        return Response(payload or '[]', mimetype='application/json')
         
     elif request.method == 'POST':
         data = request.json
         user_id = data.get('user_id')
         title = data.get('title', 'New Conversation')
         
-        c = conn.cursor()
-        c.execute('INSERT INTO conversations (user_id, title) VALUES (?, ?)', (user_id, title))
-        conn.commit()
-        conv_id = c.lastrowid
-        conn.close()
-        return jsonify({"id": conv_id, "title": title}), 201
+        with db_conn() as conn:
+            c = conn.cursor()
+            c.execute(SQL_INSERT_CONVERSATION, (user_id, title))
+            conn.commit()
+            conv_id = c.lastrowid
+        return jsonify_fast({"id": conv_id, "title": title}), 201
 
 @app.route('/conversations/<int:conversation_id>/messages', methods=['GET', 'POST'])
 def handle_messages(conversation_id):
-    conn = get_db_connection()
-    
     if request.method == 'GET':
-        messages = conn.execute('SELECT * FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC', (conversation_id,)).fetchall()
-        conn.close()
-        return jsonify([dict(m) for m in messages])
+        with db_conn(readonly=True) as conn:
+            payload = conn.execute(SQL_SELECT_MESSAGES_JSON, (conversation_id,)).fetchone()[0]
+        return Response(payload or '[]', mimetype='application/json')
         
     elif request.method == 'POST':
         data = request.json
         sender = data.get('sender')
         text = data.get('text')
         
-        c = conn.cursor()
-        c.execute('INSERT INTO messages (conversation_id, sender, text) VALUES (?, ?, ?)', (conversation_id, sender, text))
-        conn.commit()
-        msg_id = c.lastrowid
-        conn.close()
-        return jsonify({"id": msg_id, "status": "saved"}), 201
+        with db_conn() as conn:
+            c = conn.cursor()
+            c.execute(SQL_INSERT_MESSAGE, (conversation_id, sender, text))
+            conn.commit()
+            msg_id = c.lastrowid
+        return jsonify_fast({"id": msg_id, "status": "saved"}), 201
 
 if __name__ == '__main__':
     init_db()
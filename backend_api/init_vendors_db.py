@@ -1,42 +1,121 @@
 import sqlite3
-import json
 import os
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
 
 DB_NAME = "ctai.db"
 JSON_DIR = "json"
+LOAD_WORKERS = 8  # threads reading/parsing vendor JSON files
+
+# Connection pragmas and vendors DDL, each sent to SQLite as one script.
+# No separate index on name: the UNIQUE(name, location) autoindex already leads with it.
+_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-20000;
+    PRAGMA busy_timeout=5000;
+"""
+
+_VENDORS_SCHEMA = """
+    BEGIN;
+    CREATE TABLE IF NOT EXISTS vendors (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        category TEXT,
+        location TEXT,
+        rating TEXT,
+        gst TEXT,
+        verified BOOLEAN DEFAULT 1,
+        contact_person TEXT,
+        email TEXT,
+        phone TEXT,
+        website TEXT,
+        UNIQUE(name, location)
+    );
+    CREATE INDEX IF NOT EXISTS idx_vendors_location ON vendors(location);
+    COMMIT;
+"""
 
 def get_db_connection():
     conn = sqlite3.connect(DB_NAME)
     conn.row_factory = sqlite3.Row
+    conn.executescript(_PRAGMAS)
     return conn
 
 def init_vendors_table():
     conn = get_db_connection()
-    c = conn.cursor()
     
-    # Create vendors table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS vendors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            category TEXT,
-            location TEXT,
-            rating TEXT,
-            gst TEXT,
-            verified BOOLEAN DEFAULT 1,
-            contact_person TEXT,
-            email TEXT,
-            phone TEXT,
-            website TEXT,
-            UNIQUE(name, location)
-        )
-    ''')
+    # Create vendors table and its indexes in a single transaction
+    conn.executescript(_VENDORS_SCHEMA)
     
-    conn.commit()
     conn.close()
     print("Vendors table initialized.")
 
+def _extract_vendors(items, category):
+    """Yield ((name, location), vendor_data) for every item that names a seller"""
+    for item in items:
+        seller_info = item.get('seller_info', {})
+        company_info = item.get('company_info', {})
+        
+        name = seller_info.get('seller_name') or seller_info.get('contact_person')
+        if not name:
+            continue
+            
+        location = seller_info.get('location') or seller_info.get('full_address', '')
+        # Simple cleanup for location (take city/state if possible, or just first part)
+        if location and ',' in location:
+             location = location.split(',')[-1].strip() # approximate city/state
+        
+        if not location:
+            location = "Unknown"
+
+        # Extract rating
+        rating = "4.5" # Default
+        for review in item.get('reviews', []):
+            if review.get('type') == 'overall_rating':
+                rating = review.get('value', '4.5')
+                break
+        
+        yield (name, location), {
+            "name": name,
+            "category": category, # Initial category, might be overwritten if multi-category vendor
+            "location": location,
+            "rating": rating,
+            "gst": company_info.get('gst', 'N/A'),
+            "contact_person": seller_info.get('contact_person', ''),
+            "email": seller_info.get('email', ''),
+            "phone": seller_info.get('phone', ''),
+            "website": item.get('url', '')
+        }
+
+def _merge_vendor(unique_vendors, key, vendor):
+    """Keep the first record per vendor, appending categories it is seen under again"""
+    existing = unique_vendors.get(key)
+    if existing is None:
+        unique_vendors[key] = vendor
+    elif vendor["category"] not in existing["category"]:
+        existing["category"] = f"{existing['category']}, {vendor['category']}"
+
+def _process_file(json_file):
+    """Load one JSON file and return its (key, vendor_data) candidates"""
+    category = json_file.replace('_links.json', '').replace('.json', '').replace('_', ' ').title()
+    file_path = os.path.join(JSON_DIR, json_file)
+    candidates = []
+    
+    try:
+        with open(file_path, 'rb') as f:
+            data = orjson.loads(f.read())
+        
+        items = data if isinstance(data, list) else [data]
+        candidates.extend(_extract_vendors(items, category))
+
+    except Exception as e:
+        print(f"Error processing {json_file}: {str(e)}")
+    
+    return candidates
+
 def populate_vendors():
     conn = get_db_connection()
     c = conn.cursor()
@@ -46,89 +125,39 @@ def populate_vendors():
     
     unique_vendors = {} # Key: (name, location) -> vendor_data
 
-    for json_file in json_files:
-        category = json_file.replace('_links.json', '').replace('.json', '').replace('_', ' ').title()
-        file_path = os.path.join(JSON_DIR, json_file)
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-                items = data if isinstance(data, list) else [data]
-                
-                for item in items:
-                    seller_info = item.get('seller_info', {})
-                    company_info = item.get('company_info', {})
-                    
-                    name = seller_info.get('seller_name') or seller_info.get('contact_person')
-                    if not name:
-                        continue
-                        
-                    location = seller_info.get('location') or seller_info.get('full_address', '')
-                    # Simple cleanup for location (take city/state if possible, or just first part)
-                    if location and ',' in location:
-                         location = location.split(',')[-1].strip() # approximate city/state
-                    
-                    if not location:
-                        location = "Unknown"
-
-                    key = (name, location)
-                    
-                    if key not in unique_vendors:
-                        # Extract rating
-                        rating = "4.5" # Default
-                        reviews = item.get('reviews', [])
-                        for review in reviews:
-                            if review.get('type') == 'overall_rating':
-                                rating = review.get('value', '4.5')
-                                break
-                        
-                        unique_vendors[key] = {
-                            "name": name,
-                            "category": category, # Initial category, might be overwritten if multi-category vendor
-                            "location": location,
-                            "rating": rating,
-                            "gst": company_info.get('gst', 'N/A'),
-                            "contact_person": seller_info.get('contact_person', ''),
-                            "email": seller_info.get('email', ''),
-                            "phone": seller_info.get('phone', ''),
-                            "website": item.get('url', '')
-                        }
-                    else:
-                        # If vendor already exists, maybe update category to show they sell multiple things? 
-                        # For now, just keep first found category or append
-                        current_cat = unique_vendors[key]["category"]
-                        if category not in current_cat:
-                             unique_vendors[key]["category"] = f"{current_cat}, {category}"
-
-        except Exception as e:
-            print(f"Error processing {json_file}: {str(e)}")
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as ex:
+        # map() yields in file order, so merging stays deterministic
+        for batch in ex.map(_process_file, json_files):
+            for key, vendor in batch:
+                _merge_vendor(unique_vendors, key, vendor)
             
-    # Insert into DB
-    count = 0
-    for vendor in unique_vendors.values():
-        try:
-            c.execute('''
-                INSERT OR IGNORE INTO vendors 
-                (name, category, location, rating, gst, contact_person, email, phone, website)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                vendor['name'], 
-                vendor['category'], 
-                vendor['location'], 
-                vendor['rating'], 
-                vendor['gst'],
-                vendor['contact_person'],
-                vendor['email'],
-                vendor['phone'],
-                vendor['website']
-            ))
-            if c.rowcount > 0:
-                count += 1
-        except Exception as e:
-            print(f"Error inserting {vendor['name']}: {e}")
+    # Insert into DB in one statement: SQLite walks the JSON array itself via json_each,
+    # so there is a single Python -> SQLite call instead of one binding per row
+    payload = orjson.dumps(list(unique_vendors.values())).decode()
+    
+    before = conn.total_changes
+    try:
+        c.execute('''
+            INSERT OR IGNORE INTO vendors 
+            (name, category, location, rating, gst, contact_person, email, phone, website)
+            SELECT
+                json_extract(value, '$.name'),
+                json_extract(value, '$.category'),
+                json_extract(value, '$.location'),
+                json_extract(value, '$.rating'),
+                json_extract(value, '$.gst'),
+                json_extract(value, '$.contact_person'),
+                json_extract(value, '$.email'),
+                json_extract(value, '$.phone'),
+                json_extract(value, '$.website')
+            FROM json_each(?)
+        ''', (payload,))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error inserting vendors: {e}")
+    count = conn.total_changes - before
             
-    conn.commit()
     conn.close()
     print(f"Successfully inserted {count} unique vendors.")
 
@@ -4,10 +4,18 @@ Fetches vendor and material data from the n8n webhook API.
 Database (ctai.db) is kept as fallback but disabled for testing.
 """
 
-import json
+import atexit
+import logging
+import logging.handlers
+import queue
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import sqlite3
 import os
+import threading
+from cachetools import TTLCache
 from typing import List, Dict, Any
 
 # N8N Webhook URL
@@ -16,11 +24,57 @@ N8N_WEBHOOK_URL = "https://confidently-esterifiable-mira.ngrok-free.dev/webhook/
 # Set to True to enable DB fallback when n8n is unavailable
 USE_DB_FALLBACK = False
 
+# Set N8N_DEBUG_PAYLOADS=1 to log the (truncated) raw webhook payloads
+DEBUG_PAYLOADS = os.getenv("N8N_DEBUG_PAYLOADS", "0") == "1"
+
+# Records are queued on the request thread and formatted/written by a background listener
+logger = logging.getLogger("n8n")
+logger.setLevel(logging.DEBUG if DEBUG_PAYLOADS else logging.INFO)
+logger.propagate = False
+_log_queue = queue.SimpleQueue()
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("[n8n] %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 # Path to the database
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ctai.db")
 
+# Shared keep-alive session so repeat webhook calls skip DNS/TCP/TLS setup
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504],
+                       allowed_methods=["GET"], raise_on_status=False),
+))
+
+# Webhook responses cached by normalized (query, location); only non-empty results are stored
+_RESPONSE_CACHE = TTLCache(maxsize=512, ttl=300)
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
 
 def fetch_vendors_from_n8n(query: str, location: str = "", timeout: int = 30) -> List[Dict]:
+    """
+    Cached front for _fetch_vendors_from_n8n; warm queries skip the webhook round trip.
+    """
+    key = (query.lower().strip(), location.lower().strip())
+    with _RESPONSE_CACHE_LOCK:
+        cached = _RESPONSE_CACHE.get(key)
+    if cached is not None:
+        logger.info("Cache hit: product_name='%s', location='%s'", query, location)
+        return cached
+    
+    data = _fetch_vendors_from_n8n(query, location, timeout)
+    if data:
+        with _RESPONSE_CACHE_LOCK:
+            _RESPONSE_CACHE[key] = data
+    return data
+
+
+def _fetch_vendors_from_n8n(query: str, location: str = "", timeout: int = 30) -> List[Dict]:
     """
     Call the n8n webhook with a material/product query and return raw response.
     
@@ -36,40 +90,41 @@ def fetch_vendors_from_n8n(query: str, location: str = "", timeout: int = 30) ->
     params = {"product_name": query}
     if location:
         params["location"] = location
-    print(f"[n8n] Sending to webhook: product_name='{query}', location='{location}'")
+    logger.info("Sending to webhook: product_name='%s', location='%s'", query, location)
     
     try:
-        response = requests.get(
+        response = _SESSION.get(
             N8N_WEBHOOK_URL,
             params=params,
             timeout=timeout
         )
         
         if response.status_code == 200:
-            data = response.json()
-            print(f"[n8n] Raw response for '{query}': {json.dumps(data, indent=2, default=str)[:2000]}")
+            data = orjson.loads(response.content)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Raw response for '%s': %s", query, orjson.dumps(data, default=str)[:2000].decode(errors='ignore'))
             # n8n may return a list directly or wrap in an object
             if isinstance(data, list):
-                print(f"[n8n] Got {len(data)} items (list)")
+                logger.info("Got %d items (list)", len(data))
                 return data
             elif isinstance(data, dict):
                 # Handle wrapped responses
                 result = data.get("output", [data])
-                print(f"[n8n] Got {len(result) if isinstance(result, list) else 1} items (dict)")
+                logger.info("Got %d items (dict)", len(result) if isinstance(result, list) else 1)
                 return result
             return []
         else:
-            print(f"[n8n] API error: {response.status_code} - {response.text[:200]}")
+            logger.error("API error: %s - %s", response.status_code, response.text[:200])
             return []
             
     except requests.exceptions.Timeout:
-        print(f"[n8n] Request timed out for query: {query}")
+        logger.warning("Request timed out for query: %s", query)
         return []
     except requests.exceptions.ConnectionError:
-        print(f"[n8n] Connection error - webhook may be down")
+        logger.warning("Connection error - webhook may be down")
         return []
     except Exception as e:
-        print(f"[n8n] Unexpected error: {e}")
+        logger.error("Unexpected error: %s", e)
         return []
 
 
@@ -151,7 +206,7 @@ def parse_n8n_vendor_response(raw_data: List[Dict]) -> List[Dict]:
             vendors.append(vendor_entry)
             
         except Exception as e:
-            print(f"[n8n] Error parsing vendor entry: {e}")
+            logger.warning("Error parsing vendor entry: %s", e)
             continue
     
     return vendors
@@ -170,18 +225,19 @@ def search_vendors_n8n(material_query: str, location: str = "", k: int = 5) -> L
         List of vendor dicts in app standard format
     """
     # Fetch from n8n — include location in the query
-    print(f"[n8n] search_vendors_n8n called: material='{material_query}', location='{location}'")
+    logger.info("search_vendors_n8n called: material='%s', location='%s'", material_query, location)
     raw_data = fetch_vendors_from_n8n(material_query, location)
     
     if not raw_data:
-        print(f"[n8n] No data returned for query: {material_query}")
+        logger.info("No data returned for query: %s", material_query)
         return []
     
     # Parse into standard format
     vendors = parse_n8n_vendor_response(raw_data)
-    print(f"[n8n] Parsed {len(vendors)} vendors for '{material_query}':")
-    for v in vendors:
-        print(f"  - {v['vendor']} | {v['category']} | {v['location']}")
+    logger.info("Parsed %d vendors for '%s'", len(vendors), material_query)
+    if logger.isEnabledFor(logging.DEBUG):
+        for v in vendors:
+            logger.debug("  - %s | %s | %s", v['vendor'], v['category'], v['location'])
     
     # Location filtering is handled by n8n via the location param — no post-filter needed
     
@@ -214,6 +270,12 @@ def get_all_vendors_n8n(query: str = "construction materials") -> List[Dict]:
     return vendors
 
 
+# Only the columns search_vendors_db puts into its result dicts
+_SQL_VENDOR_COLUMNS = "SELECT name, category, location, contact_person, rating, gst, website FROM vendors"
+_SQL_SEARCH_VENDORS = _SQL_VENDOR_COLUMNS + " WHERE category LIKE ? OR name LIKE ? LIMIT ?"
+_SQL_SEARCH_VENDORS_AT = _SQL_VENDOR_COLUMNS + " WHERE (category LIKE ? OR name LIKE ?) AND location LIKE ? LIMIT ?"
+
+
 def search_vendors_db(material_query: str, location: str = "", k: int = 5) -> List[Dict]:
     """
     Fallback: Search vendors from the local ctai.db vendors table.
@@ -236,12 +298,12 @@ def search_vendors_db(material_query: str, location: str = "", k: int = 5) -> Li
         if location:
             loc_pattern = f"%{location}%"
             rows = conn.execute(
-                "SELECT * FROM vendors WHERE (category LIKE ? OR name LIKE ?) AND location LIKE ? LIMIT ?",
+                _SQL_SEARCH_VENDORS_AT,
                 (pattern, pattern, loc_pattern, k)
             ).fetchall()
         else:
             rows = conn.execute(
-                "SELECT * FROM vendors WHERE category LIKE ? OR name LIKE ? LIMIT ?",
+                _SQL_SEARCH_VENDORS,
                 (pattern, pattern, k)
             ).fetchall()
         
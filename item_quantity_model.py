@@ -5,15 +5,27 @@
 # ============================================================
 
 import os
+
+# OpenMP threads for numpy/xgboost, capped at roughly the physical cores; only takes
+# effect if set before those libraries are imported
+N_THREADS = max(1, (os.cpu_count() or 1) // 2)
+os.environ.setdefault('OMP_NUM_THREADS', str(N_THREADS))
+
 import numpy as np
 import pandas as pd
 import warnings
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import accuracy_score, f1_score, mean_squared_error, mean_absolute_error, r2_score
+from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import xgboost as xgb
 import joblib
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa_csv = None
+
 warnings.filterwarnings('ignore')
 
 # ============================================================
@@ -52,28 +64,75 @@ KEEP_FEATURES = [
     'UOM', 'PriceUOM',
 ]
 
+DATE_COLS = ['CONSTRUCTION_START_DATE', 'SUBSTANTIAL_COMPLETION_DATE']
+
+# Read as text so the CSV reader skips type inference on label-like columns
+STRING_COLS = ['PROJECTNUMBER', 'PROJECT_CITY', 'STATE', 'PROJECT_COUNTRY',
+               'CORE_MARKET', 'PROJECT_TYPE', 'UOM', 'PriceUOM']
+
+# Arrow fixes each column's type from the first block it reads. In train.csv MasterItemNo is
+# all-integer and MW all-empty for the first ~10.7k rows, so both need an explicit type
+ARROW_COLUMN_TYPES = {'MasterItemNo': 'string', 'MW': 'float64'}
+
+# Train on the GPU when this XGBoost build has CUDA support
+XGB_DEVICE = 'cuda' if xgb.build_info().get('USE_CUDA') else 'cpu'
+
+# Histogram bins per feature, shared by QuantileDMatrix and the training params
+MAX_BIN = 256
+
+# Compact dtypes for engineered features. XGBoost stores features as float32
+# internally, so float32 here loses nothing the model would have seen.
+FEATURE_DTYPES = {
+    **{f'{col}_encoded': np.int32 for col in [
+        'PROJECTNUMBER', 'PROJECT_CITY', 'STATE', 'PROJECT_COUNTRY',
+        'CORE_MARKET', 'PROJECT_TYPE', 'UOM', 'PriceUOM']},
+    **{col: np.float32 for col in [
+        'SIZE_BUILDINGSIZE', 'NUMFLOORS', 'NUMROOMS', 'NUMBEDS', 'MW', 'REVISED_ESTIMATE',
+        'size_per_floor', 'rooms_per_floor', 'beds_per_room',
+        'SIZE_BUILDINGSIZE_log', 'REVISED_ESTIMATE_log']},
+    'project_duration_days': np.int32,
+    **{f'{prefix}_{part}': np.int16
+       for prefix in ['start', 'complete']
+       for part in ['year', 'month', 'quarter', 'dayofweek']},
+    **{col: np.int8 for col in ['is_large_project', 'is_multi_floor', 'has_rooms', 'has_beds']},
+}
+
 
 # ============================================================
 # 2. DATA LOADING AND CLEANING
 # ============================================================
 
+def read_csv_fast(path):
+    """Read a CSV with Arrow's multithreaded parser, falling back to pandas without pyarrow.
+    
+    Dates are left as text and parsed once in engineer_features.
+    """
+    if pa_csv is None:
+        return pd.read_csv(path, dtype={col: str for col in STRING_COLS})
+    
+    table = pa_csv.read_csv(
+        path,
+        # ItemDescription has quoted values spanning lines
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={
+                **{col: pa.string() for col in STRING_COLS + DATE_COLS},
+                **{col: pa.type_for_alias(alias) for col, alias in ARROW_COLUMN_TYPES.items()},
+            },
+            strings_can_be_null=True,
+        ),
+    )
+    return table.to_pandas()
+
+
 def load_data(train_path='train.csv', test_path='test.csv'):
     """Load train and test datasets."""
     print("=" * 70)
     print("LOADING DATA")
     print("=" * 70)
     
-    train = pd.read_csv(
-        train_path,
-        parse_dates=['CONSTRUCTION_START_DATE', 'SUBSTANTIAL_COMPLETION_DATE'],
-        date_format='mixed'
-    )
-    
-    test = pd.read_csv(
-        test_path,
-        parse_dates=['CONSTRUCTION_START_DATE', 'SUBSTANTIAL_COMPLETION_DATE'],
-        date_format='mixed'
-    )
+    train = read_csv_fast(train_path)
+    test = read_csv_fast(test_path)
     
     print(f"Train shape: {train.shape}")
     print(f"Test shape: {test.shape}")
@@ -81,21 +140,13 @@ def load_data(train_path='train.csv', test_path='test.csv'):
     return train, test
 
 
-def clean_numeric(value):
-    """Clean numeric values."""
-    if pd.isna(value) or value == '' or value is None:
-        return np.nan
-    if isinstance(value, (int, float)):
-        return float(value)
+def vec_clean_numeric(series):
+    """Clean numeric values for a whole column (strip thousands separators, coerce junk to NaN)."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
     
-    value = str(value).replace(',', '').strip()
-    if value == '' or value == '-':
-        return np.nan
-    
-    try:
-        return float(value)
-    except:
-        return np.nan
+    cleaned = series.astype(str).str.replace(',', '', regex=False).str.strip()
+    return pd.to_numeric(cleaned.replace({'': np.nan, '-': np.nan}), errors='coerce')
 
 
 # ============================================================
@@ -132,17 +183,15 @@ def engineer_features(train_df, test_df):
     # Create product lookup (MasterItemNo -> ItemDescription)
     product_lookup = train_df.groupby('MasterItemNo')['ItemDescription'].first().to_dict()
     
-    # Mark datasets
-    train_df = train_df.copy()
-    test_df = test_df.copy()
-    train_df['_is_train'] = 1
-    test_df['_is_train'] = 0
-    
-    # Combine for consistent processing
-    combined = pd.concat([train_df, test_df], axis=0, ignore_index=True)
+    # Combine for consistent processing; the outer index level marks each row's source
+    # so no marker column or defensive copies of the inputs are needed
+    combined = pd.concat([train_df, test_df], axis=0, keys=['train', 'test'])
     
     # ===== Date Features =====
     print("Extracting date features...")
+    for col in DATE_COLS:
+        if col in combined.columns:
+            combined[col] = pd.to_datetime(combined[col], format='mixed', errors='coerce')
     combined = extract_date_features(combined, 'CONSTRUCTION_START_DATE', 'start')
     combined = extract_date_features(combined, 'SUBSTANTIAL_COMPLETION_DATE', 'complete')
     
@@ -154,12 +203,8 @@ def engineer_features(train_df, test_df):
     
     # ===== Size-based Features =====
     print("Creating size-based features...")
-    combined['SIZE_BUILDINGSIZE'] = combined['SIZE_BUILDINGSIZE'].apply(clean_numeric).fillna(0)
-    combined['NUMFLOORS'] = combined['NUMFLOORS'].apply(clean_numeric).fillna(0)
-    combined['NUMROOMS'] = combined['NUMROOMS'].apply(clean_numeric).fillna(0)
-    combined['NUMBEDS'] = combined['NUMBEDS'].apply(clean_numeric).fillna(0)
-    combined['MW'] = combined['MW'].apply(clean_numeric).fillna(0)
-    combined['REVISED_ESTIMATE'] = combined['REVISED_ESTIMATE'].apply(clean_numeric).fillna(0)
+    for col in ['SIZE_BUILDINGSIZE', 'NUMFLOORS', 'NUMROOMS', 'NUMBEDS', 'MW', 'REVISED_ESTIMATE']:
+        combined[col] = vec_clean_numeric(combined[col]).fillna(0)
     
     combined['size_per_floor'] = np.where(
         combined['NUMFLOORS'] > 0,
@@ -184,21 +229,24 @@ def engineer_features(train_df, test_df):
     
     # ===== Binary Indicators =====
     print("Creating binary indicators...")
-    combined['is_large_project'] = (combined['SIZE_BUILDINGSIZE'] > combined['SIZE_BUILDINGSIZE'].quantile(0.75)).astype(int)
-    combined['is_multi_floor'] = (combined['NUMFLOORS'] > 1).astype(int)
-    combined['has_rooms'] = (combined['NUMROOMS'] > 0).astype(int)
-    combined['has_beds'] = (combined['NUMBEDS'] > 0).astype(int)
+    size_q75 = combined['SIZE_BUILDINGSIZE'].quantile(0.75)
+    combined = combined.assign(
+        is_large_project=(combined['SIZE_BUILDINGSIZE'] > size_q75).to_numpy(np.int8),
+        is_multi_floor=(combined['NUMFLOORS'] > 1).to_numpy(np.int8),
+        has_rooms=(combined['NUMROOMS'] > 0).to_numpy(np.int8),
+        has_beds=(combined['NUMBEDS'] > 0).to_numpy(np.int8),
+    )
     
     # ===== Encode Categorical Variables =====
     print("Encoding categorical variables...")
     categorical_cols = ['PROJECTNUMBER', 'PROJECT_CITY', 'STATE', 'PROJECT_COUNTRY', 
                         'CORE_MARKET', 'PROJECT_TYPE', 'UOM', 'PriceUOM']
     
+    # Sorted category codes match what LabelEncoder would assign, in one C pass
     for col in categorical_cols:
         if col in combined.columns:
             combined[col] = combined[col].fillna('UNKNOWN').astype(str)
-            le = LabelEncoder()
-            combined[f'{col}_encoded'] = le.fit_transform(combined[col])
+            combined[f'{col}_encoded'] = combined[col].astype('category').cat.codes.astype(np.int32)
     
     # ===== Select Final Features =====
     feature_cols = [
@@ -217,8 +265,6 @@ def engineer_features(train_df, test_df):
         'complete_year', 'complete_month', 'complete_quarter', 'complete_dayofweek',
         # Binary
         'is_large_project', 'is_multi_floor', 'has_rooms', 'has_beds',
-        # Marker
-        '_is_train'
     ]
     
     # Keep only existing columns
@@ -228,14 +274,17 @@ def engineer_features(train_df, test_df):
     # ===== Handle Missing Values =====
     print("Handling missing values...")
     for col in combined.columns:
-        if col != '_is_train':
-            combined[col] = combined[col].replace([np.inf, -np.inf], np.nan)
-            combined[col] = combined[col].fillna(0)
+        combined[col] = combined[col].replace([np.inf, -np.inf], np.nan)
+        combined[col] = combined[col].fillna(0)
+    
+    # ===== Downcast =====
+    for col, dtype in FEATURE_DTYPES.items():
+        if col in combined.columns:
+            combined[col] = combined[col].astype(dtype)
     
     # ===== Split Back =====
-    is_train_mask = combined['_is_train'] == 1
-    X_train = combined[is_train_mask].drop(columns=['_is_train'])
-    X_test = combined[~is_train_mask].drop(columns=['_is_train'])
+    X_train = combined.loc['train'].reset_index(drop=True)
+    X_test = combined.loc['test'].reset_index(drop=True)
     
     print(f"\nFinal feature shape - Train: {X_train.shape}, Test: {X_test.shape}")
     print(f"Features used: {list(X_train.columns)}")
@@ -258,10 +307,9 @@ def prepare_targets(y_master_item, y_qty):
     
     # Handle rare classes (< 2 samples)
     class_counts = y_master_item.value_counts()
-    rare_classes = class_counts[class_counts < 2].index.tolist()
-    print(f"Rare classes with <2 samples: {len(rare_classes)}")
+    print(f"Rare classes with <2 samples: {int((class_counts < 2).sum())}")
     
-    y_master_grouped = y_master_item.replace(rare_classes, 'RARE_CLASS')
+    y_master_grouped = y_master_item.where(y_master_item.map(class_counts) >= 2, 'RARE_CLASS')
     
     # Encode
     master_encoder = LabelEncoder()
@@ -270,7 +318,7 @@ def prepare_targets(y_master_item, y_qty):
     print(f"Number of classes: {n_classes}")
     
     # Regression target: QtyShipped
-    y_qty = y_qty.apply(clean_numeric)
+    y_qty = vec_clean_numeric(y_qty)
     y_reg = y_qty.fillna(y_qty.median())
     y_reg = np.clip(y_reg, 0, None)
     
@@ -283,20 +331,39 @@ def prepare_targets(y_master_item, y_qty):
 # 5. MODEL TRAINING
 # ============================================================
 
-def train_classifier(X_train, y_train, X_val, y_val, n_classes):
+def accuracy_and_weighted_f1(y_true, y_pred, n_classes):
+    """(accuracy, support-weighted F1) from per-class bincounts, as sklearn computes them"""
+    y_true = np.asarray(y_true, dtype=np.int64)
+    y_pred = np.asarray(y_pred, dtype=np.int64)
+    correct = y_true == y_pred
+    
+    tp = np.bincount(y_true[correct], minlength=n_classes)
+    support = np.bincount(y_true, minlength=n_classes)
+    predicted = np.bincount(y_pred, minlength=n_classes)
+    # 2*tp / (support + predicted) is per-class F1, 0 for classes that never appear
+    f1 = 2 * tp / np.maximum(support + predicted, 1)
+    return correct.mean(), (f1 * support).sum() / support.sum()
+
+
+def train_classifier(dtrain, dval, y_train, y_val, n_classes):
     """Train XGBoost classifier for MasterItemNo."""
     print("\n" + "=" * 70)
     print("TRAINING CLASSIFIER (MasterItemNo)")
     print("=" * 70)
     
-    dtrain = xgb.DMatrix(X_train, label=y_train)
-    dval = xgb.DMatrix(X_val, label=y_val)
+    dtrain.set_info(label=y_train)
+    dval.set_info(label=y_val)
     
     params = {
         'objective': 'multi:softmax',
         'num_class': n_classes,
         'tree_method': 'hist',
-        'max_depth': 8,
+        'max_bin': MAX_BIN,
+        'nthread': N_THREADS,
+        'device': XGB_DEVICE,
+        'grow_policy': 'lossguide',
+        'max_leaves': 64,
+        'max_depth': 0,
         'eta': 0.1,
         'subsample': 0.8,
         'colsample_bytree': 0.8,
@@ -317,8 +384,7 @@ def train_classifier(X_train, y_train, X_val, y_val, n_classes):
     
     # Evaluate
     y_pred = clf.predict(dval)
-    accuracy = accuracy_score(y_val, y_pred)
-    f1 = f1_score(y_val, y_pred, average='weighted', zero_division=0)
+    accuracy, f1 = accuracy_and_weighted_f1(y_val, y_pred, n_classes)
     
     print(f"\n>>> Classification Metrics:")
     print(f"    Accuracy: {accuracy:.4f}")
@@ -327,19 +393,24 @@ def train_classifier(X_train, y_train, X_val, y_val, n_classes):
     return clf, accuracy, clf.best_iteration
 
 
-def train_regressor(X_train, y_train, X_val, y_val):
+def train_regressor(dtrain, dval, y_train, y_val):
     """Train XGBoost regressor for QtyShipped."""
     print("\n" + "=" * 70)
     print("TRAINING REGRESSOR (QtyShipped)")
     print("=" * 70)
     
-    dtrain = xgb.DMatrix(X_train, label=y_train)
-    dval = xgb.DMatrix(X_val, label=y_val)
+    dtrain.set_info(label=y_train)
+    dval.set_info(label=y_val)
     
     params = {
         'objective': 'reg:squarederror',
         'tree_method': 'hist',
-        'max_depth': 8,
+        'max_bin': MAX_BIN,
+        'nthread': N_THREADS,
+        'device': XGB_DEVICE,
+        'grow_policy': 'lossguide',
+        'max_leaves': 64,
+        'max_depth': 0,
         'eta': 0.1,
         'subsample': 0.8,
         'colsample_bytree': 0.8,
@@ -372,21 +443,38 @@ def train_regressor(X_train, y_train, X_val, y_val):
     return reg, rmse, reg.best_iteration
 
 
+def train_both(X_train, X_val, y_cls_train, y_cls_val, y_reg_train, y_reg_val, n_classes):
+    """Train the classifier and regressor on one shared pair of quantized matrices."""
+    # Quantize once; validation reuses the training cut points and each model sets its own labels
+    dtrain = xgb.QuantileDMatrix(X_train, label=y_cls_train, max_bin=MAX_BIN)
+    dval = xgb.QuantileDMatrix(X_val, label=y_cls_val, ref=dtrain)
+    
+    clf, clf_accuracy, best_clf_iter = train_classifier(dtrain, dval, y_cls_train, y_cls_val, n_classes)
+    reg, reg_rmse, best_reg_iter = train_regressor(dtrain, dval, y_reg_train, y_reg_val)
+    
+    return clf, clf_accuracy, best_clf_iter, reg, reg_rmse, best_reg_iter
+
+
 def train_final_models(X_train, y_cls, y_reg, n_classes, best_clf_iter, best_reg_iter):
     """Train final models on full data."""
     print("\n" + "=" * 70)
     print("TRAINING FINAL MODELS ON FULL DATA")
     print("=" * 70)
     
-    dtrain_cls = xgb.DMatrix(X_train, label=y_cls)
-    dtrain_reg = xgb.DMatrix(X_train, label=y_reg)
+    # One quantized matrix for both models; only the label is swapped between them
+    dtrain = xgb.QuantileDMatrix(X_train, label=y_cls, max_bin=MAX_BIN)
     
     # Classifier
     clf_params = {
         'objective': 'multi:softmax',
         'num_class': n_classes,
         'tree_method': 'hist',
-        'max_depth': 8,
+        'max_bin': MAX_BIN,
+        'nthread': N_THREADS,
+        'device': XGB_DEVICE,
+        'grow_policy': 'lossguide',
+        'max_leaves': 64,
+        'max_depth': 0,
         'eta': 0.1,
         'subsample': 0.8,
         'colsample_bytree': 0.8,
@@ -394,13 +482,18 @@ def train_final_models(X_train, y_cls, y_reg, n_classes, best_clf_iter, best_reg
         'seed': 42
     }
     
-    clf = xgb.train(clf_params, dtrain_cls, num_boost_round=best_clf_iter + 30)
+    clf = xgb.train(clf_params, dtrain, num_boost_round=best_clf_iter + 30)
     
     # Regressor
     reg_params = {
         'objective': 'reg:squarederror',
         'tree_method': 'hist',
-        'max_depth': 8,
+        'max_bin': MAX_BIN,
+        'nthread': N_THREADS,
+        'device': XGB_DEVICE,
+        'grow_policy': 'lossguide',
+        'max_leaves': 64,
+        'max_depth': 0,
         'eta': 0.1,
         'subsample': 0.8,
         'colsample_bytree': 0.8,
@@ -408,7 +501,8 @@ def train_final_models(X_train, y_cls, y_reg, n_classes, best_clf_iter, best_reg
         'seed': 42
     }
     
-    reg = xgb.train(reg_params, dtrain_reg, num_boost_round=best_reg_iter + 30)
+    dtrain.set_info(label=y_reg)
+    reg = xgb.train(reg_params, dtrain, num_boost_round=best_reg_iter + 30)
     
     print("Final models trained!")
     return clf, reg
@@ -469,11 +563,12 @@ if __name__ == "__main__":
     print(f"\nTrain: {len(X_tr)}, Validation: {len(X_val)}")
     
     # Train models
-    clf, clf_acc, best_clf = train_classifier(X_tr.values, y_cls_tr, X_val.values, y_cls_val, n_classes)
-    reg, reg_rmse, best_reg = train_regressor(X_tr.values, y_reg_tr, X_val.values, y_reg_val)
+    clf, clf_acc, best_clf, reg, reg_rmse, best_reg = train_both(
+        X_tr, X_val, y_cls_tr, y_cls_val, y_reg_tr, y_reg_val, n_classes
+    )
     
     # Final models
-    clf_final, reg_final = train_final_models(X_train.values, y_cls, y_reg.values, n_classes, best_clf, best_reg)
+    clf_final, reg_final = train_final_models(X_train, y_cls, y_reg.values, n_classes, best_clf, best_reg)
     
     # Save
     save_models(clf_final, reg_final, master_encoder, product_lookup)
@@ -483,7 +578,7 @@ if __name__ == "__main__":
     print("GENERATING PREDICTIONS")
     print("=" * 70)
     
-    dtest = xgb.DMatrix(X_test.values)
+    dtest = xgb.DMatrix(X_test)
     
     test_cls_pred = clf_final.predict(dtest)
     test_master_pred = master_encoder.inverse_transform(test_cls_pred.astype(int))
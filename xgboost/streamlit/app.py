@@ -1,142 +1,457 @@
+import asyncio
+import functools
+import hashlib
 import json
 import os
 import re
-from typing import List, Dict, Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, AsyncIterator, Callable
 import pandas as pd
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-import requests
+import orjson
+import httpx
 from datetime import datetime
+from types import SimpleNamespace
 import joblib
+import xgboost as xgb
 import warnings
 import traceback
 from scipy import sparse
 import streamlit as st
 from dotenv import load_dotenv
-import time  # Added for rate limit handling
 import matplotlib.pyplot as plt  # Added for Gantt chart
-from dateutil.relativedelta import relativedelta  # For date calculations
 
 warnings.filterwarnings('ignore')
 
 # Load environment variables
 load_dotenv()
 
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "llama-3.1-8b-instant"  # Updated to current supported model
+# Groq requests allowed in flight at once; keep it under the account's requests-per-minute limit
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "4"))
+GROQ_MAX_RETRIES = 3
+GROQ_RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Pooled keep-alive connections to the Groq endpoint
+GROQ_MAX_CONNECTIONS = 16
+# Prompts are cut to this many tokens; the answer prompt packs retrieved documents into its own budget
+MAX_PROMPT_TOKENS = 750
+RESPONSE_CONTEXT_TOKENS = 300
+# The fused answer + timeline + schedule prompt carries all three output formats
+REPORT_MAX_PROMPT_TOKENS = 1500
+# Materials per ML-input prompt; past ~8 the model starts dropping or merging objects
+ML_INPUT_BATCH_SIZE = 8
+
+# FAISS: an HNSW graph over fp16 copies of the vectors for small corpora; IVF-PQ (16 x 8-bit codes, ~16 B
+# per vector instead of 1536) once there are enough vectors to train the 256-centroid PQ codebooks
+# Vectors are L2-normalized and compared by inner product (= cosine similarity, higher is closer)
+FAISS_METRIC = faiss.METRIC_INNER_PRODUCT
+IVFPQ_MIN_DOCS = 10000
+IVFPQ_M = 16
+IVFPQ_NBITS = 8
+IVF_NPROBE = 16
+HNSW_M = 32
+# Build-time candidate list; larger gives a better graph (higher recall) for a one-off build cost
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# HNSW keeps its vectors as fp16: half the memory and bandwidth per distance, with negligible loss on unit vectors
+HNSW_STORAGE = faiss.ScalarQuantizer.QT_fp16
+
+# Documents per embedding forward pass when building the index
+EMBED_BATCH_SIZE = 256
+# Search issued once at startup to warm the encoder and FAISS index
+PRELOAD_WARMUP_QUERY = "construction material suppliers in Navi Mumbai"
+# Answers kept per RAG instance for plain queries (e.g. the per-material vendor searches) and full reports
+ANSWER_CACHE_SIZE = 512
+
+# Per-document embeddings (keyed by a hash of the document text) and the last built index live here
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", ".embedding_cache")
+
+try:
+    import tiktoken
+    _TOKENIZER = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or the BPE file can't be fetched
+    _TOKENIZER = None
+
+def count_tokens(text: str) -> int:
+    """Token count under cl100k_base (~4 chars per token without tiktoken)"""
+    if _TOKENIZER is None:
+        return (len(text) + 3) // 4
+    return len(_TOKENIZER.encode(text))
+
+def truncate_to_tokens(text: str, max_tokens: int):
+    """Cut text to at most max_tokens tokens; returns (text, was_truncated)"""
+    if _TOKENIZER is None:
+        max_chars = max_tokens * 4
+        return (text[:max_chars], True) if len(text) > max_chars else (text, False)
+    tokens = _TOKENIZER.encode(text)
+    if len(tokens) <= max_tokens:
+        return text, False
+    return _TOKENIZER.decode(tokens[:max_tokens]), True
+
+# Output formats shared by the single-purpose prompts and the fused report prompt
+ANSWER_FORMAT = """Products:
+1. Name: [name]
+   Brand: [brand]
+   Availability: [availability]
+   Location: [location]
+   Vendor: [vendor]
+   URL: [url]
+
+Vendors:
+1. Company Name: [company]
+   Address: [address]
+   GST Status: [gst]
+   Rating: [rating]"""
+
+TIMELINE_FORMAT = """Output of Procurement Timeline:
+1. Electrical Equipment
+| Item | Lead Time | Order By | Delivery Window | Notes |
+|------|-----------|----------|-----------------|-------|
+| Transformers | 50 weeks | Feb 1, 2026 | Dec 2026 | Potential delays |
+
+2. Mechanical Equipment
+| Item | Lead Time | Order By | Delivery Window | Notes |
+|------|-----------|----------|-----------------|-------|
+| Cement | In-stock | Immediate | Immediate | Standard material |
+
+Use industry-standard lead times. Only include relevant items from materials."""
+
+SCHEDULE_FORMAT = """Output of Integrated with Construction Project Schedule:
+WBS Level 2: 1. Design & Engineering
+| ID | Task | Duration | Start | Finish | Notes |
+|----|------|----------|-------|--------|-------|
+| 1.1 | Conceptual Design | 30 days | 01-Jan-2026 | 30-Jan-2026 | 30% Design |
+
+WBS Level 2: 2. Mech & Electrical Installations
+| ID | Task | Duration | Start | Finish | Notes |
+|----|------|----------|-------|--------|-------|
+| 2.1 | Transformer Installation | 15 days | 01-Dec-2026 | 15-Dec-2026 | |
+
+Use typical construction timelines. Only include relevant items from materials."""
+
+_REPORT_SECTION_RE = re.compile(r'^\s*#{2,3}\s*(Products|Timeline|Schedule)\s*$', re.IGNORECASE | re.MULTILINE)
+def _split_report(text: str) -> Dict[str, str]:
+    """{'products'|'timeline'|'schedule': body} for the non-empty sections of a report reply"""
+    parts = _REPORT_SECTION_RE.split(text)
+    # split() with one group gives [preamble, name, body, name, body, ...]
+    return {name.lower(): body.strip() for name, body in zip(parts[1::2], parts[2::2]) if body.strip()}
+
+_VENDOR_RE = re.compile(r'Vendors:\s*1\.\s*Company Name: (.*?)\s*Address: (.*?)\s*GST Status: (.*?)\s*Rating: (.*)', re.DOTALL)
+
+def _transformer_estimate(power):
+    units = max(3, power / 5)
+    return units, f"Units ({power / units:.1f}MVA)", units * 6.67
+
+# (requirement, material, formula, notes): formula maps the requirement value to
+# (quantity, unit, cost in crores); rules fire in this order when their requirement is set
+MATERIAL_RULES = [
+    ("built_up_area", "Cement",
+     lambda area: (area * 0.4 / 30, "Cubic Meters", area * 0.4 / 30 * 6000 / 100000),
+     "Based on standard construction norms (0.4 bags per square foot)"),
+    ("built_up_area", "Bricks",
+     lambda area: (area * 8, "Units", area * 8 * 0.08 / 100000),
+     "Based on standard construction norms (8 bricks per square foot)"),
+    ("power_capacity", "Medium Voltage Switchgear",
+     lambda power: (max(5, power / 2.5), "LineUps", max(5, power / 2.5) * 0.2),
+     "Based on power capacity of {value} MW"),
+    ("power_capacity", "Transformers", _transformer_estimate,
+     "Based on power capacity of {value} MW"),
+    ("power_capacity", "Chillers / CRAHs / CRACs",
+     lambda power: (max(10, power * 2), "Units", max(10, power * 2) * 0.3),
+     "Based on power capacity of {value} MW"),
+]
+
+def format_material(material: Dict[str, Any]):
+    """(Re)build a material's display strings from its numeric quantity and cost"""
+    material["Quantity"] = f"{material['quantity']:.0f} {material['unit']}"
+    material["Unit Cost (Rupees)"] = f"{material['cost_crores']:.2f} Crores"
+
+def _read_json_file(path: str):
+    """(parsed JSON, None) or (None, exception); runs on a worker thread, so no Streamlit calls"""
+    try:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read()), None
+    except Exception as e:
+        return None, e
+
 class IndiaMART_RAG:
+    _POWER_RE = re.compile(r'(\d+)\s*Mega?Watt', re.IGNORECASE)
+    _AREA_RE = re.compile(r'(\d+)\s*Lacs?\s*SquareFoot', re.IGNORECASE)
+    _VOLUME_RE = re.compile(r'(\d+)\s*Cr\s*(in\s*Rupees)?', re.IGNORECASE)
+    _LOCATION_RE = re.compile(r'in\s+([\w\s]+)$', re.IGNORECASE)
+    _FIRE_RE = re.compile(r'fire retardant|fireproof')
+    
     def __init__(self, json_dir: str = "json", embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"):
         self.json_dir = json_dir
         self.embedding_model_name = embedding_model
         self.embedding_model = SentenceTransformer(embedding_model)
+        if self.embedding_model.device.type == 'cuda':
+            # FP16 weights/activations halve the memory traffic of the encoder on GPU
+            self.embedding_model.half()
         self.index = None
         self.documents = []
+        self.doc_hashes = []
         self.metadata = []
+        self.meta_df = None
+        self.predicate_bitmaps = {}
+        # Repeated queries (e.g. the per-material vendor searches) reuse their embedding
+        self._embed_query = functools.lru_cache(maxsize=512)(self._encode_query)
+        # Keys carry the index version, so re-indexing makes every older answer unreachable
+        self._answer_cache = OrderedDict()
+        self._index_version = 0
         self.groq_api_key = os.getenv("GROQ_API_KEY")
+        self._loop = None
+        self._aclient = None
+        self._semaphore = None
+        # When set to a list, loading/indexing messages are queued there instead of drawn (see _status)
+        self.status_messages = None
         if not self.groq_api_key:
             raise ValueError("Groq API key missing. Set GROQ_API_KEY in .env file. Get a key from https://console.groq.com/keys")
 
-    def _call_groq_api(self, prompt: str, max_tokens: int = 1024) -> str:
-        """Helper to call Groq API with optimized token handling and rate limit delay"""
-        time.sleep(2)  # Increased delay to 2 seconds to avoid 429 errors
-        # Truncate prompt to ~3000 chars (~750 tokens) to stay safe
-        if len(prompt) > 3000:
-            prompt = prompt[:3000] + "\n... (truncated to fit token limit)"
-            st.warning(f"Prompt truncated to ~750 tokens to avoid context length issues.")
+    def _status(self, level: str, message: str):
+        """st.write/st.error a loading or indexing message, or queue it when the index is built off the script thread"""
+        if self.status_messages is not None:
+            self.status_messages.append((level, message))
+        else:
+            getattr(st, level)(message)
+
+    def run(self, coro):
+        """Run a coroutine to completion with this instance's async Groq client and throttle"""
+        # One event loop per instance, reused across calls (and Streamlit reruns), so the client
+        # bound to it keeps its pooled keep-alive connections instead of re-handshaking each run
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+            self._aclient = None
+        return self._loop.run_until_complete(self._with_client(coro))
+
+    async def _with_client(self, coro):
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(
+                timeout=60,
+                # Transport-level retries cover connect failures; status retries are in achat_completion
+                transport=httpx.AsyncHTTPTransport(
+                    retries=2,
+                    limits=httpx.Limits(max_connections=GROQ_MAX_CONNECTIONS,
+                                        max_keepalive_connections=GROQ_MAX_CONNECTIONS),
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+        return await coro
+
+    async def achat_completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a chat completion to Groq; 429s wait out Retry-After, 5xx back off, then try again"""
+        headers = {
+            "Authorization": f"Bearer {self.groq_api_key}",
+            "Content-Type": "application/json"
+        }
+        for attempt in range(GROQ_MAX_RETRIES):
+            async with self._semaphore:
+                response = await self._aclient.post(GROQ_API_URL, headers=headers, json=payload)
+            if response.status_code not in GROQ_RETRY_STATUSES or attempt == GROQ_MAX_RETRIES - 1:
+                break
+            await asyncio.sleep(self._retry_delay(response, attempt))
+        response.raise_for_status()
+        return response.json()
+
+    async def astream_chat_completion(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """achat_completion with "stream": True, yielding the content deltas as Groq's SSE frames arrive.
+        Retries only happen before a reply starts"""
+        headers = {
+            "Authorization": f"Bearer {self.groq_api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {**payload, "stream": True}
+        for attempt in range(GROQ_MAX_RETRIES):
+            async with self._semaphore:
+                async with self._aclient.stream("POST", GROQ_API_URL, headers=headers, json=payload) as response:
+                    if response.status_code == 200:
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                return
+                            choices = orjson.loads(data).get('choices')
+                            if choices and choices[0].get('delta', {}).get('content'):
+                                yield choices[0]['delta']['content']
+                        return
+                    await response.aread()
+            if response.status_code not in GROQ_RETRY_STATUSES or attempt == GROQ_MAX_RETRIES - 1:
+                response.raise_for_status()
+            await asyncio.sleep(self._retry_delay(response, attempt))
+
+    @staticmethod
+    def _retry_delay(response: httpx.Response, attempt: int) -> float:
+        """429s wait out Retry-After; 5xx back off exponentially"""
+        if response.status_code == 429:
+            try:
+                return float(response.headers.get("Retry-After", 10))
+            except ValueError:
+                return 10
+        return 0.5 * 2 ** attempt
+
+    async def _acall_groq_api(self, prompt: str, max_tokens: int = 1024) -> str:
+        """Helper to call Groq API with optimized token handling and rate limit retries"""
+        # Truncate prompt to MAX_PROMPT_TOKENS tokens to stay safe
+        prompt, truncated = truncate_to_tokens(prompt, MAX_PROMPT_TOKENS)
+        if truncated:
+            prompt += "\n... (truncated to fit token limit)"
+            st.warning(f"Prompt truncated to {MAX_PROMPT_TOKENS} tokens to avoid context length issues.")
 
         try:
-            headers = {
-                "Authorization": f"Bearer {self.groq_api_key}",
-                "Content-Type": "application/json"
-            }
             payload = {
-                "model": "llama-3.1-8b-instant",  # Updated to current supported model
+                "model": GROQ_MODEL,
                 "messages": [{"role": "user", "content": prompt}],
                 "max_tokens": max_tokens,
                 "temperature": 0.7
             }
-            response = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
+            data = await self.achat_completion(payload)
             if 'choices' in data and len(data['choices']) > 0:
                 return data['choices'][0]['message']['content']
             else:
                 st.error("Invalid API response format.")
                 return "Error: Invalid API response."
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             error_msg = f"API HTTP Error: {str(e)} - {e.response.text}"  # Added response.text for full error details
             if e.response.status_code == 400:
                 error_msg += f" - Possible context length issue. Prompt length: {len(prompt)} chars."
             elif e.response.status_code == 401:
                 error_msg += " - Invalid API key."
             elif e.response.status_code == 429:
-                error_msg += " - Rate limit exceeded. Retrying after delay..."
-                time.sleep(10)  # Longer backoff for rate limit
-                return self._call_groq_api(prompt, max_tokens)  # Retry once
+                error_msg += f" - Rate limit exceeded after {GROQ_MAX_RETRIES} attempts."
             st.error(error_msg)
             return f"Error: {error_msg}"
         except Exception as e:
             st.error(f"General Error: {str(e)}")
             return f"Error: {str(e)}"
 
-    def generate_response(self, query: str, context: List[Dict[str, Any]], requirements: Dict[str, Any] = None, material_estimates: List[Dict[str, Any]] = None) -> str:
-        """Generate response using Groq API with minimal context"""
-        # Limit to 1 document to reduce tokens
-        context_text = ""
-        for i, result in enumerate(context[:1]):
-            doc_str = f"Title: {result['metadata']['title']}\nURL: {result['metadata']['url']}\nDetails: {json.dumps(result['metadata']['details'], separators=(',', ':'))[:200]}"
-            context_text += f"Document {i+1}:\n{doc_str[:300]}\n\n"
+    def _call_groq_api(self, prompt: str, max_tokens: int = 1024) -> str:
+        """Blocking wrapper around _acall_groq_api"""
+        return self.run(self._acall_groq_api(prompt, max_tokens))
+
+    async def abatch(self, prompts: List[str], max_tokens: int = 1024) -> List[str]:
+        """Send several prompts concurrently; results come back in prompt order"""
+        return await asyncio.gather(*(self._acall_groq_api(p, max_tokens) for p in prompts))
+
+    def _context_text(self, context: List[Dict[str, Any]], material_estimates: List[Dict[str, Any]] = None) -> str:
+        """Retrieved documents plus the lead material, for the answer and report prompts"""
+        # Pack whole documents, best match first, into RESPONSE_CONTEXT_TOKENS; only a first
+        # document that is too big on its own gets cut
+        parts = []
+        budget = RESPONSE_CONTEXT_TOKENS
+        for i, result in enumerate(context):
+            doc_str = f"Document {i+1}:\nTitle: {result['metadata']['title']}\nURL: {result['metadata']['url']}\nDetails: {json.dumps(result['metadata']['details'], separators=(',', ':'))}\n\n"
+            doc_tokens = count_tokens(doc_str)
+            if doc_tokens > budget:
+                if i == 0:
+                    parts.append(truncate_to_tokens(doc_str, budget)[0] + "\n\n")
+                break
+            parts.append(doc_str)
+            budget -= doc_tokens
 
         if material_estimates:
-            context_text += "Materials:\n" + "\n".join([f"{m['Material/Equipment']}: {m['Quantity']}" for m in material_estimates[:1]])
+            parts.append("Materials:\n")
+            parts.append("\n".join([f"{m['Material/Equipment']}: {m['Quantity']}" for m in material_estimates[:1]]))
+        return "".join(parts)
 
+    def _response_prompt(self, query: str, context: List[Dict[str, Any]], material_estimates: List[Dict[str, Any]] = None) -> str:
+        """Build the answer prompt from minimal context"""
         prompt = f"""
 Assistant for construction procurement. Use context from IndiaMART database.
 Context:
-{context_text}
+{self._context_text(context, material_estimates)}
 Query: {query}
 Instructions:
 - Use only context info.
 - Output in structured format:
-Products:
-1. Name: [name]
-   Brand: [brand]
-   Availability: [availability]
-   Location: [location]
-   Vendor: [vendor]
-   URL: [url]
-
-Vendors:
-1. Company Name: [company]
-   Address: [address]
-   GST Status: [gst]
-   Rating: [rating]
+{ANSWER_FORMAT}
 - Be concise and factual.
 Answer:
 """
-        return self._call_groq_api(prompt, max_tokens=512)
+        return prompt
+
+    def generate_response(self, query: str, context: List[Dict[str, Any]], requirements: Dict[str, Any] = None, material_estimates: List[Dict[str, Any]] = None) -> str:
+        """Generate response using Groq API with minimal context"""
+        return self._call_groq_api(self._response_prompt(query, context, material_estimates), max_tokens=512)
+
+    async def agenerate_response(self, query: str, context: List[Dict[str, Any]], requirements: Dict[str, Any] = None, material_estimates: List[Dict[str, Any]] = None) -> str:
+        """Async generate_response"""
+        return await self._acall_groq_api(self._response_prompt(query, context, material_estimates), max_tokens=512)
 
     def load_and_process_json_files(self):
         """Load all JSON files from the directory and process them"""
-        st.write("Loading JSON files...")
+        self._status('write', "Loading JSON files...")
        
         json_files = [f for f in os.listdir(self.json_dir) if f.endswith('.json')]
        
-        for json_file in json_files:
-            file_path = os.path.join(self.json_dir, json_file)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                   
+        # File reads and orjson parsing release the GIL, so files are parsed on a thread pool;
+        # items are processed here, in file order, so documents/metadata need no locking
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            parsed = executor.map(_read_json_file, [os.path.join(self.json_dir, f) for f in json_files])
+            for json_file, (data, error) in zip(json_files, parsed):
+                if error is not None:
+                    self._status('error', f"Error loading {json_file}: {str(error)}")
+                    continue
+                
+                try:
                     if isinstance(data, list):
                         for item in data:
                             self._process_item(item)
                     else:
                         self._process_item(data)
-                       
-            except Exception as e:
-                st.error(f"Error loading {json_file}: {str(e)}")
+                except Exception as e:
+                    self._status('error', f"Error loading {json_file}: {str(e)}")
                
-        st.write(f"Loaded {len(self.documents)} documents")
+        self._build_meta_df()
+        self._status('write', f"Loaded {len(self.documents)} documents")
+   
+    @staticmethod
+    def _overall_rating(reviews) -> float:
+        """First parseable 'overall_rating' review value, else NaN"""
+        for review in reviews if isinstance(reviews, list) else []:
+            if isinstance(review, dict) and review.get('type') == 'overall_rating':
+                try:
+                    return float(review.get('value', 0))
+                except (ValueError, TypeError):
+                    pass
+        return np.nan
+   
+    def _build_meta_df(self):
+        """Columnar copy of the fields filter_by_criteria tests, normalized once at load time"""
+        def as_dict(value):
+            return value if isinstance(value, dict) else {}
+        
+        company_info = [as_dict(m['company_info']) for m in self.metadata]
+        details = [as_dict(m['details']) for m in self.metadata]
+        self.meta_df = pd.DataFrame({
+            'address_lower': pd.Series(
+                [f"{c.get('full_address', '')} {as_dict(m['seller_info']).get('full_address', '')}"
+                 for c, m in zip(company_info, self.metadata)], dtype=object).str.lower(),
+            'gst_year': pd.to_datetime(
+                pd.Series([str(c.get('gst_registration_date', '')) for c in company_info], dtype=object),
+                format='%d-%m-%Y', errors='coerce').dt.year,
+            'overall_rating': [self._overall_rating(m['reviews']) for m in self.metadata],
+            'availability_lower': pd.Series([str(d.get('availability', '')) for d in details], dtype=object).str.lower(),
+            'details_text_lower': pd.Series(
+                [f"{d} {m['description']}" for d, m in zip(details, self.metadata)], dtype=object).str.lower(),
+        })
+        
+        # Fixed-meaning query predicates, evaluated for every document once and packed 8 per byte
+        # (missing GST dates / ratings are NaN and come out False)
+        df = self.meta_df
+        flags = {
+            'location:navi mumbai': df['address_lower'].str.contains('navi mumbai', regex=False),
+            'gst_after_2017': df['gst_year'] > 2017,
+            'rating_ge_4': df['overall_rating'] >= 4.0,
+            'in_stock': df['availability_lower'].str.contains('in stock', regex=False),
+            'fire_retardant': df['details_text_lower'].str.contains(self._FIRE_RE),
+        }
+        self.predicate_bitmaps = {name: np.packbits(flag.to_numpy(dtype=bool)) for name, flag in flags.items()}
    
     def _process_item(self, item: Dict[str, Any]):
         """Process a single item from JSON and add to documents"""
@@ -172,6 +487,7 @@ Answer:
        
         if text.strip():
             self.documents.append(text)
+            self.doc_hashes.append(hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest())
             self.metadata.append({
                 'url': item.get('url', ''),
                 'title': item.get('title', ''),
@@ -185,18 +501,104 @@ Answer:
     def build_faiss_index(self):
         """Build FAISS index from documents"""
         if not self.documents:
-            st.error("No documents to index!")
+            self._status('error', "No documents to index!")
             return
+        self._index_version += 1
            
-        st.write("Building FAISS index...")
+        os.makedirs(EMBED_CACHE_DIR, exist_ok=True)
+        index_path = os.path.join(EMBED_CACHE_DIR, "faiss.index")
+        manifest_path = os.path.join(EMBED_CACHE_DIR, "manifest.json")
+        # Same model + same documents in the same order -> the saved index is still valid
+        manifest = hashlib.blake2b(
+            "\n".join([self.embedding_model_name, f"metric={FAISS_METRIC}", f"efConstruction={HNSW_EF_CONSTRUCTION}",
+                       f"hnsw_storage={HNSW_STORAGE}",
+                       *self.doc_hashes]).encode('utf-8'), digest_size=16
+        ).hexdigest()
+        if os.path.exists(index_path) and os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                if json.load(f).get('manifest') == manifest:
+                    self.load_index(index_path)
+                    self._status('write', f"Loaded cached FAISS index ({self.index.ntotal} vectors)")
+                    return
        
-        embeddings = self.embedding_model.encode(self.documents, show_progress_bar=True)
+        self._status('write', "Building FAISS index...")
        
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(np.array(embeddings).astype('float32'))
+        embeddings = self._embed_documents()
+        faiss.normalize_L2(embeddings)  # in place; the fp16 encoder's output is only approximately unit length
        
-        st.write("FAISS index built successfully")
+        num_docs, dimension = embeddings.shape
+        if num_docs >= IVFPQ_MIN_DOCS:
+            nlist = min(4096, 4 * int(np.sqrt(num_docs)))
+            quantizer = faiss.IndexFlatIP(dimension)
+            self.index = faiss.IndexIVFPQ(quantizer, dimension, nlist, IVFPQ_M, IVFPQ_NBITS, FAISS_METRIC)
+            self.index.train(embeddings)
+        else:
+            self.index = faiss.IndexHNSWSQ(dimension, HNSW_STORAGE, HNSW_M, FAISS_METRIC)
+            self.index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            self.index.train(embeddings)  # no-op for fp16, which needs no codebook
+        self._set_search_params()
+        self.index.add(embeddings)
+       
+        self.save_index(index_path)
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({'manifest': manifest, 'model': self.embedding_model_name, 'num_docs': num_docs}, f)
+       
+        self._status('write', f"FAISS index built successfully ({type(self.index).__name__}, {num_docs} vectors)")
+   
+    def _embed_documents(self) -> np.ndarray:
+        """Embeddings for self.documents, encoding only documents missing from the on-disk cache"""
+        model_tag = re.sub(r'[^\w.-]', '_', self.embedding_model_name)
+        cache_path = os.path.join(EMBED_CACHE_DIR, f"embeddings_{model_tag}.npz")
+        cached = {}
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cache:
+                cached = dict(zip(cache['hashes'].tolist(), cache['vectors']))
+       
+        missing = [i for i, h in enumerate(self.doc_hashes) if h not in cached]
+        self._status('write', f"Embedding cache: {len(self.documents) - len(missing)} hits, {len(missing)} to encode")
+        if missing:
+            # encode() already length-sorts its inputs before batching and returns them in input order
+            new_vectors = self.embedding_model.encode(
+                [self.documents[i] for i in missing],
+                batch_size=EMBED_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=True,
+            )
+            for i, vector in zip(missing, new_vectors):
+                cached[self.doc_hashes[i]] = vector
+       
+        embeddings = np.ascontiguousarray(np.stack([cached[h] for h in self.doc_hashes]), dtype='float32')
+        if missing:
+            np.savez(cache_path, hashes=np.array(self.doc_hashes), vectors=embeddings)
+        return embeddings
+   
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Normalized float32 embedding for one query, shaped (1, dim) for index.search"""
+        embedding = np.ascontiguousarray(self.embedding_model.encode([query]), dtype='float32')
+        faiss.normalize_L2(embedding)
+        return embedding
+   
+    def _set_search_params(self):
+        """Apply the query-time accuracy/speed knobs for the current index type"""
+        if isinstance(self.index, faiss.IndexIVF):
+            self.index.nprobe = IVF_NPROBE
+        elif isinstance(self.index, faiss.IndexHNSW):
+            self.index.hnsw.efSearch = HNSW_EF_SEARCH
+   
+    def save_index(self, path: str):
+        """Write the FAISS index to disk"""
+        faiss.write_index(self.index, path)
+   
+    def load_index(self, path: str):
+        """Memory-map a saved FAISS index so its pages are read on demand"""
+        self._index_version += 1
+        try:
+            self.index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # Not every index type can be memory-mapped; read it normally instead
+            self.index = faiss.read_index(path)
+        self._set_search_params()
    
     def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
         """Search for similar documents to the query"""
@@ -205,81 +607,83 @@ Answer:
        
         k = min(k, len(self.documents))
        
-        query_embedding = self.embedding_model.encode([query])
+        query_embedding = self._embed_query(query)
        
-        distances, indices = self.index.search(np.array(query_embedding).astype('float32'), k)
+        # Inner-product scores come back highest (most similar) first
+        scores, indices = self.index.search(query_embedding, k)
+        return self._search_results(scores[0], indices[0])
+   
+    def search_batch(self, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """search() for several queries with one encoder batch and one index.search call"""
+        if self.index is None or len(self.documents) == 0:
+            raise ValueError("Index not built or no documents loaded")
        
+        k = min(k, len(self.documents))
+       
+        query_embeddings = np.ascontiguousarray(self.embedding_model.encode(queries), dtype='float32')
+        faiss.normalize_L2(query_embeddings)
+        scores, indices = self.index.search(query_embeddings, k)
+        return [self._search_results(row_scores, row_indices) for row_scores, row_indices in zip(scores, indices)]
+   
+    def _search_results(self, scores: np.ndarray, indices: np.ndarray) -> List[Dict[str, Any]]:
+        """Result dicts for one row of index.search output"""
         results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.metadata):
+        for i, idx in enumerate(indices):
+            # IVF pads with -1 when the probed cells hold fewer than k vectors
+            if 0 <= idx < len(self.metadata):
                 results.append({
+                    'doc_id': int(idx),
                     'document': self.documents[idx],
                     'metadata': self.metadata[idx],
-                    'distance': float(distances[0][i])
+                    'score': float(scores[i])
                 })
        
         return results
    
     def filter_by_criteria(self, results: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
         """Apply additional filtering based on query criteria"""
-        filtered_results = []
-       
-        for result in results:
-            metadata = result['metadata']
-            company_info = metadata.get('company_info', {})
-            details = metadata.get('details', {})
-           
-            if "in " in query.lower() or "navi mumbai" in query.lower():
-                location_match = re.search(r'in\s+([\w\s]+)$', query.lower())
-                location = "navi mumbai" if "navi mumbai" in query.lower() else None
-                if location_match and not location:
+        if not results:
+            return results
+        
+        query_lower = query.lower()
+        doc_ids = np.fromiter((result['doc_id'] for result in results), dtype=np.intp, count=len(results))
+        keep = np.ones(len(results), dtype=bool)
+        active = []
+        
+        if "in " in query_lower or "navi mumbai" in query_lower:
+            location = "navi mumbai" if "navi mumbai" in query_lower else None
+            if not location:
+                location_match = self._LOCATION_RE.search(query_lower)
+                if location_match:
                     location = location_match.group(1).strip()
-               
-                if location:
-                    address = str(company_info.get('full_address', '')).lower() + " " + str(metadata.get('seller_info', {}).get('full_address', '')).lower()
-                    if location not in address:
-                        continue
-           
-            if "gst after 2017" in query.lower():
-                gst_date = company_info.get('gst_registration_date', '')
-                if gst_date:
-                    try:
-                        date_obj = datetime.strptime(gst_date, '%d-%m-%Y')
-                        if date_obj.year <= 2017:
-                            continue
-                    except ValueError:
-                        continue
+            
+            if location:
+                if f"location:{location}" in self.predicate_bitmaps:
+                    active.append(f"location:{location}")
                 else:
-                    continue
-           
-            if "high rating" in query.lower() or "rating" in query.lower():
-                reviews = metadata.get('reviews', [])
-                overall_rating = None
-                for review in reviews:
-                    if review.get('type') == 'overall_rating':
-                        try:
-                            overall_rating = float(review.get('value', 0))
-                            break
-                        except (ValueError, TypeError):
-                            pass
-               
-                if overall_rating is None or overall_rating < 4.0:
-                    continue
-           
-            if "available in stock" in query.lower() or "in stock" in query.lower():
-                availability = str(details.get('availability', '')).lower()
-                if 'in stock' not in availability:
-                    continue
-           
-            if "fire retardant" in query.lower() or "fireproof" in query.lower():
-                details_text = str(details).lower() + " " + str(metadata.get('description', '')).lower()
-                if 'fire retardant' not in details_text and 'fireproof' not in details_text:
-                    continue
-           
-            filtered_results.append(result)
-       
-        return filtered_results
-   
+                    # Free-text location: substring test on the candidates' addresses
+                    addresses = self.meta_df['address_lower'].iloc[doc_ids]
+                    keep &= addresses.str.contains(location, regex=False).to_numpy()
+        
+        if "gst after 2017" in query_lower:
+            active.append('gst_after_2017')
+        
+        if "rating" in query_lower:  # also covers "high rating"
+            active.append('rating_ge_4')
+        
+        if "in stock" in query_lower:  # also covers "available in stock"
+            active.append('in_stock')
+        
+        if "fire retardant" in query_lower or "fireproof" in query_lower:
+            active.append('fire_retardant')
+        
+        if active:
+            # AND the packed bitmaps a byte (8 documents) at a time, then read each candidate's bit
+            combined = np.bitwise_and.reduce([self.predicate_bitmaps[name] for name in active])
+            keep &= ((combined[doc_ids >> 3] >> (7 - (doc_ids & 7))) & 1).astype(bool)
+        
+        return [result for result, kept in zip(results, keep) if kept]
+    
     def extract_project_requirements(self, query: str) -> Dict[str, Any]:
         """Extract project requirements from the query"""
         requirements = {
@@ -290,19 +694,19 @@ Answer:
             "materials": {}
         }
        
-        power_match = re.search(r'(\d+)\s*Mega?Watt', query, re.IGNORECASE)
+        power_match = self._POWER_RE.search(query)
         if power_match:
             requirements["power_capacity"] = float(power_match.group(1))
        
-        area_match = re.search(r'(\d+)\s*Lacs?\s*SquareFoot', query, re.IGNORECASE)
+        area_match = self._AREA_RE.search(query)
         if area_match:
             requirements["built_up_area"] = float(area_match.group(1)) * 100000
        
-        volume_match = re.search(r'(\d+)\s*Cr\s*(in\s*Rupees)?', query, re.IGNORECASE)
+        volume_match = self._VOLUME_RE.search(query)
         if volume_match:
             requirements["project_volume"] = float(volume_match.group(1)) * 10000000
        
-        location_match = re.search(r'in\s+([\w\s]+)$', query, re.IGNORECASE)
+        location_match = self._LOCATION_RE.search(query)
         if location_match:
             requirements["location"] = location_match.group(1).strip()
        
@@ -314,55 +718,14 @@ Answer:
     def estimate_material_requirements(self, requirements: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Estimate material requirements based on project specifications"""
         materials = []
-       
-        if requirements.get("built_up_area"):
-            area = requirements["built_up_area"]
-           
-            cement_bags = area * 0.4
-            cement_cubic_meters = cement_bags / 30
-            materials.append({
-                "Material/Equipment": "Cement",
-                "Quantity": f"{cement_cubic_meters:.0f} Cubic Meters",
-                "Unit Cost (Rupees)": f"{(cement_cubic_meters * 6000 / 100000):.2f} Crores",
-                "Notes": "Based on standard construction norms (0.4 bags per square foot)"
-            })
-           
-            bricks = area * 8
-            materials.append({
-                "Material/Equipment": "Bricks",
-                "Quantity": f"{bricks:.0f} Units",
-                "Unit Cost (Rupees)": f"{(bricks * 0.08 / 100000):.2f} Crores",
-                "Notes": "Based on standard construction norms (8 bricks per square foot)"
-            })
-       
-        if requirements.get("power_capacity"):
-            power = requirements["power_capacity"]
-           
-            switchgear_lineups = max(5, power / 2.5)
-            materials.append({
-                "Material/Equipment": "Medium Voltage Switchgear",
-                "Quantity": f"{switchgear_lineups:.0f} LineUps",
-                "Unit Cost (Rupees)": f"{switchgear_lineups * 0.2:.2f} Crores",
-                "Notes": f"Based on power capacity of {power} MW"
-            })
-           
-            transformer_units = max(3, power / 5)
-            transformer_capacity = power / transformer_units
-            materials.append({
-                "Material/Equipment": "Transformers",
-                "Quantity": f"{transformer_units:.0f} Units ({transformer_capacity:.1f}MVA)",
-                "Unit Cost (Rupees)": f"{transformer_units * 6.67:.2f} Crores",
-                "Notes": f"Based on power capacity of {power} MW"
-            })
-           
-            cooling_units = max(10, power * 2)
-            materials.append({
-                "Material/Equipment": "Chillers / CRAHs / CRACs",
-                "Quantity": f"{cooling_units:.0f} Units",
-                "Unit Cost (Rupees)": f"{cooling_units * 0.3:.2f} Crores",
-                "Notes": f"Based on power capacity of {power} MW"
-            })
-       
+        for key, name, formula, notes in MATERIAL_RULES:
+            value = requirements.get(key)
+            if value:
+                quantity, unit, cost_crores = formula(value)
+                material = {"Material/Equipment": name, "quantity": quantity, "unit": unit,
+                            "cost_crores": cost_crores, "Notes": notes.format(value=value)}
+                format_material(material)
+                materials.append(material)
         return materials
    
     def format_material_table(self, materials: List[Dict[str, Any]]) -> str:
@@ -377,21 +740,47 @@ Answer:
        
         return table
    
-    def query(self, query: str, k: int = 10, apply_filters: bool = True) -> Dict[str, Any]:
+    def query(self, query: str, k: int = 10, apply_filters: bool = True,
+              material_estimates: List[Dict[str, Any]] = None, full_report: bool = False,
+              on_report_update: Callable[[Dict[str, str]], None] = None) -> Dict[str, Any]:
+        return self.run(self.aquery(query, k=k, apply_filters=apply_filters,
+                                    material_estimates=material_estimates, full_report=full_report,
+                                    on_report_update=on_report_update))
+
+    async def aquery(self, query: str, k: int = 10, apply_filters: bool = True,
+                     material_estimates: List[Dict[str, Any]] = None, full_report: bool = False,
+                     search_results: List[Dict[str, Any]] = None,
+                     on_report_update: Callable[[Dict[str, str]], None] = None) -> Dict[str, Any]:
+        """Answer a query; with full_report (and materials) the timeline and schedule come from the same LLM call,
+        streamed to on_report_update if given. search_results, if given, stands in for self.search(query, k)"""
+        # Only plain queries are cached: caller-supplied materials change between plans
+        cache_key = None
+        if material_estimates is None and not full_report:
+            cache_key = self._answer_cache_key(query, k, apply_filters)
+            cached = self._recall(cache_key)
+            if cached is not None:
+                return cached
+        
         requirements = self.extract_project_requirements(query)
-        material_estimates = []
-       
-        if any([requirements["power_capacity"], requirements["built_up_area"], requirements["project_volume"]]):
-            material_estimates = self.estimate_material_requirements(requirements)
+        if material_estimates is None:
+            material_estimates = []
+            if any([requirements["power_capacity"], requirements["built_up_area"], requirements["project_volume"]]):
+                material_estimates = self.estimate_material_requirements(requirements)
        
-        search_results = self.search(query, k=k)
+        if search_results is None:
+            search_results = self.search(query, k=k)
        
         if apply_filters:
             filtered_results = self.filter_by_criteria(search_results, query)
         else:
             filtered_results = search_results
        
-        response = self.generate_response(query, filtered_results, requirements, material_estimates)
+        timeline = schedule = None
+        if full_report and material_estimates:
+            response, timeline, schedule = await agenerate_full_report(self, query, filtered_results, material_estimates,
+                                                                       on_update=on_report_update)
+        else:
+            response = await self.agenerate_response(query, filtered_results, requirements, material_estimates)
        
         sources = [result['metadata']['url'] for result in filtered_results if result['metadata']['url']]
        
@@ -400,12 +789,44 @@ Answer:
             table = self.format_material_table(material_estimates)
             final_response += f"\n\n{table}"
        
-        return {
+        result = {
             'answer': final_response,
             'sources': sources,
             'num_results': len(filtered_results),
-            'material_estimates': material_estimates
+            'material_estimates': material_estimates,
+            'timeline': timeline,
+            'schedule': schedule
         }
+        # Failed Groq calls come back as "Error: ..." text; retry those next time
+        if cache_key is not None and not response.startswith("Error:"):
+            self._remember(cache_key, result)
+        return result
+    
+    async def aquery_batch(self, queries: List[str], k: int = 10, apply_filters: bool = True) -> List[Any]:
+        """aquery for several plain queries: uncached ones share one embedding batch and one FAISS
+        search, then all are answered concurrently. A failed query comes back as its exception"""
+        misses = [q for q in queries if self._answer_cache_key(q, k, apply_filters) not in self._answer_cache]
+        searched = dict(zip(misses, self.search_batch(misses, k=k))) if misses else {}
+        return await asyncio.gather(
+            *(self.aquery(q, k=k, apply_filters=apply_filters, search_results=searched.get(q)) for q in queries),
+            return_exceptions=True
+        )
+    
+    def _answer_cache_key(self, query: str, k: int, apply_filters: bool) -> tuple:
+        normalized = " ".join(query.lower().split())
+        return (self._index_version, hashlib.sha1(normalized.encode()).hexdigest(), k, apply_filters)
+    
+    def _recall(self, key: tuple):
+        """Cached value for key (marked most recently used), or None"""
+        value = self._answer_cache.get(key)
+        if value is not None:
+            self._answer_cache.move_to_end(key)
+        return value
+    
+    def _remember(self, key: tuple, value):
+        self._answer_cache[key] = value
+        if len(self._answer_cache) > ANSWER_CACHE_SIZE:
+            self._answer_cache.popitem(last=False)
 
 def check_files():
     files = [
@@ -444,13 +865,16 @@ def clean_numeric_value(value, clip_negative=True, replace_zero_epsilon=False):
    
     return value
 
+# Anything that is neither alphanumeric nor whitespace (\w minus '_' is exactly str.isalnum)
+_NON_ALNUM_RE = re.compile(r'[^\w\s]|_')
+
 def clean_text_value(text):
     if pd.isna(text) or text is None:
         return "missing"
    
     text = str(text).strip().lower()
     text = text.replace('\n', ' ').replace('\r', ' ')
-    text = ''.join([c if c.isalnum() or c.isspace() else ' ' for c in text])
+    text = _NON_ALNUM_RE.sub(' ', text)
     text = ' '.join(text.split())
    
     return text
@@ -485,20 +909,31 @@ def prepare_date_features(input_data, date_feature_names):
         except:
             pass
    
-    date_df = pd.DataFrame(columns=date_feature_names)
-   
-    for feature in date_feature_names:
-        if feature in date_features:
-            date_df.at[0, feature] = date_features[feature]
-        else:
-            date_df.at[0, feature] = np.nan
+    # One float row in date_feature_names order; features not computed stay NaN for the imputer
+    positions = {name: i for i, name in enumerate(date_feature_names)}
+    row = np.full((1, len(date_feature_names)), np.nan, dtype=np.float32)
+    for feature, value in date_features.items():
+        if feature in positions:
+            row[0, positions[feature]] = value
    
-    return date_df
+    return row
+
+def impute_row(imputer, row):
+    """imputer.transform, skipped when the row has nothing to fill"""
+    row = np.asarray(row, dtype=np.float64).reshape(1, -1)
+    # SimpleImputer drops columns that were all-NaN at fit time (NaN statistic); only skip when it keeps them all
+    if not np.isnan(row).any() and not np.isnan(getattr(imputer, 'statistics_', np.nan)).any():
+        return row
+    return imputer.transform(row)
+
+def build_category_index(categorical_mapping):
+    """{column: {category: one-hot position}} so featurization is a dict lookup per column"""
+    return {c: {cat: i for i, cat in enumerate(top_categories)} for c, top_categories in categorical_mapping.items()}
 
 def prepare_features(input_data, tfidf_vectorizer, numeric_imputer, date_imputer,
-                    categorical_mapping, date_feature_names):
+                    categorical_mapping, date_feature_names, category_index=None, text_features=None):
     cleaned_desc = clean_text_value(input_data.get('ItemDescription', ''))
-    X_text = tfidf_vectorizer.transform([cleaned_desc])
+    X_text = text_features(cleaned_desc) if text_features is not None else tfidf_vectorizer.transform([cleaned_desc])
    
     numeric_features = ['ExtendedQuantity', 'UnitPrice', 'ExtendedPrice', 'invoiceTotal']
     numeric_values = []
@@ -511,36 +946,89 @@ def prepare_features(input_data, tfidf_vectorizer, numeric_imputer, date_imputer
         numeric_values.append(cleaned_value)
    
     numeric_values = [np.log1p(x) if x >= 0 else 0 for x in numeric_values]
-    X_numeric = numeric_imputer.transform([numeric_values])
+    X_numeric = impute_row(numeric_imputer, numeric_values)
    
-    date_df = prepare_date_features(input_data, date_feature_names)
-    X_date = date_imputer.transform(date_df)
+    X_date = impute_row(date_imputer, prepare_date_features(input_data, date_feature_names))
    
     cat_cols = ['PROJECT_CITY', 'STATE', 'PROJECT_COUNTRY', 'CORE_MARKET', 'PROJECT_TYPE', 'UOM']
-    cat_features = []
+    if category_index is None:
+        category_index = build_category_index(categorical_mapping)
+    # Column of the set one-hot slot per categorical block, offset past the earlier blocks
+    cat_positions = []
+    offset = 0
    
     for c in cat_cols:
         value = str(input_data.get(c, 'missing')).lower().strip()
-        if c in categorical_mapping:
-            top_categories = categorical_mapping[c]
-            if value in top_categories:
-                cat_features.extend([1 if value == cat else 0 for cat in top_categories])
-                cat_features.append(0)
-            else:
-                cat_features.extend([0] * len(top_categories))
-                cat_features.append(1)
+        if c in category_index:
+            positions = category_index[c]
+            # One slot per top category plus a trailing "other" slot
+            cat_positions.append(offset + positions.get(value, len(positions)))
+            offset += len(positions) + 1
    
-    X_categorical = np.array([cat_features])
+    X_categorical = sparse.csr_matrix(
+        (np.ones(len(cat_positions), dtype=np.float32),
+         (np.zeros(len(cat_positions), dtype=np.int32), cat_positions)),
+        shape=(1, offset),
+    )
    
+    # float32 throughout: XGBoost predicts in float32 anyway. Numeric and date values are joined
+    # densely first, so they become one CSR block instead of two
+    X_dense = np.concatenate([np.ravel(X_numeric), np.ravel(X_date)]).astype(np.float32)
     X_combined = sparse.hstack([
         X_text,
-        sparse.csr_matrix(X_numeric),
-        sparse.csr_matrix(X_date),
-        sparse.csr_matrix(X_categorical)
-    ]).tocsr()
+        sparse.csr_matrix(X_dense.reshape(1, -1)),
+        X_categorical
+    ], format='csr', dtype=np.float32)
    
     return X_combined
 
+def _load_xgb_model(model_cls, name: str):
+    """Load an XGBoost sklearn model from its UBJSON copy (made by convert_models.py) when that copy is
+    at least as new as the pickle; otherwise from the pickle"""
+    ubj_path, pkl_path = f"{name}.ubj", f"{name}.pkl"
+    if os.path.exists(ubj_path):
+        if not os.path.exists(pkl_path) or os.path.getmtime(ubj_path) >= os.path.getmtime(pkl_path):
+            model = model_cls()
+            model.load_model(ubj_path)
+            return model
+        st.warning(f"{ubj_path} is older than {pkl_path}; loading the pickle. Run convert_models.py to refresh it.")
+    return joblib.load(pkl_path)
+
+@st.cache_resource
+def load_ml_artifacts(available_files: tuple) -> SimpleNamespace:
+    """Deserialize the preprocessing pickles once per server process; every rerun and session shares them"""
+    categorical_mapping = joblib.load('categorical_mapping.pkl')
+    tfidf_vectorizer = joblib.load('tfidf_vectorizer.pkl', mmap_mode='r')
+    det_items = joblib.load('deterministic_mapping_full.pkl', mmap_mode='r') if 'deterministic_mapping_full.pkl' in available_files else {}
+    return SimpleNamespace(
+        tfidf_vectorizer=tfidf_vectorizer,
+        # Materials in one project often yield the same cleaned description; hstack copies the result, so sharing it is safe
+        text_features=functools.lru_cache(maxsize=4096)(lambda desc: tfidf_vectorizer.transform([desc])),
+        numeric_imputer=joblib.load('numeric_imputer.pkl', mmap_mode='r'),
+        date_imputer=joblib.load('date_imputer.pkl', mmap_mode='r'),
+        categorical_mapping=categorical_mapping,
+        category_index=build_category_index(categorical_mapping),
+        # Plain dict: membership and lookup without pandas index overhead
+        det_items=det_items.to_dict() if isinstance(det_items, pd.Series) else dict(det_items),
+        date_feature_names=joblib.load('date_feature_names.pkl') if 'date_feature_names.pkl' in available_files else [
+            'construction_duration_days', 'invoice_year', 'invoice_month',
+            'invoice_day', 'invoice_dayofweek', 'invoice_quarter'
+        ],
+        regression_available='xgb_regressor_full.pkl' in available_files,
+        classification_available=all(f in available_files for f in ['xgb_classifier_full.pkl', 'label_encoder_full.pkl', 'class_mapping_full.pkl']),
+    )
+
+@st.cache_resource
+def load_regressor():
+    """QtyShipped regressor, loaded the first time a prediction needs it"""
+    return _load_xgb_model(xgb.XGBRegressor, 'xgb_regressor_full')
+
+@st.cache_resource
+def load_classifier():
+    """(classifier, label encoder, class mapping), loaded the first time a description misses the deterministic map"""
+    return (_load_xgb_model(xgb.XGBClassifier, 'xgb_classifier_full'),
+            joblib.load('label_encoder_full.pkl'), joblib.load('class_mapping_full.pkl'))
+
 def run_ml_prediction(input_data: Dict[str, Any]) -> Dict[str, Any]:
     try:
         available_files, missing_files = check_files()
@@ -548,39 +1036,27 @@ def run_ml_prediction(input_data: Dict[str, Any]) -> Dict[str, Any]:
         if 'tfidf_vectorizer.pkl' not in available_files:
             return {'error': 'TFIDF vectorizer missing'}
        
-        tfidf_vectorizer = joblib.load('tfidf_vectorizer.pkl')
-        numeric_imputer = joblib.load('numeric_imputer.pkl')
-        date_imputer = joblib.load('date_imputer.pkl')
-        categorical_mapping = joblib.load('categorical_mapping.pkl')
-       
-        det_items = joblib.load('deterministic_mapping_full.pkl') if 'deterministic_mapping_full.pkl' in available_files else pd.Series()
-       
-        date_feature_names = joblib.load('date_feature_names.pkl') if 'date_feature_names.pkl' in available_files else [
-            'construction_duration_days', 'invoice_year', 'invoice_month',
-            'invoice_day', 'invoice_dayofweek', 'invoice_quarter'
-        ]
+        artifacts = load_ml_artifacts(tuple(available_files))
+        features = []
        
-        regression_available = 'xgb_regressor_full.pkl' in available_files
-        if regression_available:
-            xgb_regressor = joblib.load('xgb_regressor_full.pkl')
-       
-        classification_available = all(f in available_files for f in ['xgb_classifier_full.pkl', 'label_encoder_full.pkl', 'class_mapping_full.pkl'])
-        if classification_available:
-            xgb_classifier = joblib.load('xgb_classifier_full.pkl')
-            label_encoder = joblib.load('label_encoder_full.pkl')
-            class_mapping = joblib.load('class_mapping_full.pkl')
-       
-        X_features = prepare_features(input_data, tfidf_vectorizer, numeric_imputer,
-                                      date_imputer, categorical_mapping, date_feature_names)
+        def get_features():
+            # TF-IDF, imputers and one-hots run at most once, and only if a model needs them
+            if not features:
+                features.append(prepare_features(input_data, artifacts.tfidf_vectorizer, artifacts.numeric_imputer,
+                                                 artifacts.date_imputer, artifacts.categorical_mapping,
+                                                 artifacts.date_feature_names, category_index=artifacts.category_index,
+                                                 text_features=artifacts.text_features))
+            return features[0]
        
         cleaned_desc = clean_text_value(input_data.get('ItemDescription', ''))
        
-        if cleaned_desc in det_items.index:
-            master_item_no = det_items[cleaned_desc]
+        if cleaned_desc in artifacts.det_items:
+            master_item_no = artifacts.det_items[cleaned_desc]
             prediction_method = "deterministic"
-        elif classification_available:
-            X_dense = X_features.toarray()
-            pred_encoded = xgb_classifier.predict(X_dense)
+        elif artifacts.classification_available:
+            xgb_classifier, label_encoder, class_mapping = load_classifier()
+            # CSR goes straight to XGBoost's sparse predictor (the models were trained on CSR too)
+            pred_encoded = xgb_classifier.predict(get_features())
             pred_processed = label_encoder.inverse_transform(pred_encoded)
             master_item_no = class_mapping.get(pred_processed[0], 'unknown')
             prediction_method = "classification_model"
@@ -588,9 +1064,8 @@ def run_ml_prediction(input_data: Dict[str, Any]) -> Dict[str, Any]:
             master_item_no = "unknown"
             prediction_method = "no_model"
        
-        if regression_available:
-            X_dense = X_features.toarray()
-            qty_shipped = xgb_regressor.predict(X_dense)[0]
+        if artifacts.regression_available:
+            qty_shipped = load_regressor().predict(get_features())[0]
             qty_shipped = max(1, int(qty_shipped))
         else:
             extended_qty = clean_numeric_value(input_data.get('ExtendedQuantity', 1))
@@ -605,12 +1080,9 @@ def run_ml_prediction(input_data: Dict[str, Any]) -> Dict[str, Any]:
     except Exception as e:
         return {'error': str(e)}
 
-def generate_ml_input(query: str, material: str, groq_api_key: str) -> Dict[str, Any]:
-    prompt = f"""
-Project: {query}
-Material: {material}
-Generate a valid JSON dictionary with double quotes around all keys and string values. Do not use single quotes. Use this structure:
-{{
+def _ml_input_schema(material: str) -> str:
+    """JSON skeleton the model fills in for one material"""
+    return f"""{{
   "ItemDescription": "description with {material}",
   "ExtendedQuantity": 100,
   "UnitPrice": 1000,
@@ -626,25 +1098,27 @@ Generate a valid JSON dictionary with double quotes around all keys and string v
   "PROJECT_TYPE": "Commercial",
   "UOM": "Units",
   "Material": "{material}"
-}}
+}}"""
+
+async def agenerate_ml_input(rag: IndiaMART_RAG, query: str, material: str) -> Dict[str, Any]:
+    prompt = f"""
+Project: {query}
+Material: {material}
+Generate a valid JSON dictionary with double quotes around all keys and string values. Do not use single quotes. Use this structure:
+{_ml_input_schema(material)}
 Output only the JSON object, nothing else.
 """
-    if len(prompt) > 3000:
-        prompt = prompt[:3000] + "\n... (truncated)"
+    prompt, truncated = truncate_to_tokens(prompt, MAX_PROMPT_TOKENS)
+    if truncated:
+        prompt += "\n... (truncated)"
     
     try:
-        headers = {
-            "Authorization": f"Bearer {groq_api_key}",
-            "Content-Type": "application/json"
-        }
         payload = {
-            "model": "llama-3.1-8b-instant",  # Updated to current supported model
+            "model": GROQ_MODEL,
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": 512
         }
-        response = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
+        data = await rag.achat_completion(payload)
         if 'choices' in data and len(data['choices']) > 0:
             content = data['choices'][0]['message']['content'].strip()
             # Attempt to fix common JSON issues
@@ -677,7 +1151,42 @@ Output only the JSON object, nothing else.
             "UOM": "Units"
         }
 
-def generate_timeline(materials: List[Dict], query: str, groq_api_key: str) -> str:
+async def _agenerate_ml_input_chunk(rag: IndiaMART_RAG, query: str, materials: List[str]) -> List[Dict[str, Any]]:
+    """One Groq call returning a JSON array of ML inputs; per-material calls if it can't be parsed"""
+    if len(materials) == 1:
+        return [await agenerate_ml_input(rag, query, materials[0])]
+    
+    prompt = f"""
+Project: {query}
+Materials: {json.dumps(materials)}
+For each of the materials above, in the same order, generate one JSON dictionary with double quotes around all keys and string values. Do not use single quotes. Each dictionary uses this structure, with <material> replaced by that material:
+{_ml_input_schema("<material>")}
+Output only a JSON array with exactly {len(materials)} objects, nothing else.
+"""
+    try:
+        payload = {
+            "model": GROQ_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 320 * len(materials)
+        }
+        data = await rag.achat_completion(payload)
+        content = data['choices'][0]['message']['content'].strip()
+        json_match = re.search(r'\[.*\]', content, re.DOTALL)
+        if json_match:
+            ml_inputs = json.loads(json_match.group())
+            if isinstance(ml_inputs, list) and len(ml_inputs) == len(materials) and all(isinstance(m, dict) for m in ml_inputs):
+                return ml_inputs
+    except Exception:
+        pass
+    return list(await asyncio.gather(*(agenerate_ml_input(rag, query, m) for m in materials)))
+
+async def agenerate_ml_inputs_batch(rag: IndiaMART_RAG, query: str, materials: List[str]) -> List[Dict[str, Any]]:
+    """ML inputs for several materials, ML_INPUT_BATCH_SIZE materials per Groq call, batches sent concurrently"""
+    chunks = [materials[i:i + ML_INPUT_BATCH_SIZE] for i in range(0, len(materials), ML_INPUT_BATCH_SIZE)]
+    results = await asyncio.gather(*(_agenerate_ml_input_chunk(rag, query, chunk) for chunk in chunks))
+    return [ml_input for chunk in results for ml_input in chunk]
+
+async def agenerate_timeline(rag: IndiaMART_RAG, materials: List[Dict], query: str) -> str:
     material_list = "\n".join([f"- {m['Material/Equipment']}: {m['Quantity']}" for m in materials[:1]])
     prompt = f"""
 Date: September 14, 2025
@@ -685,35 +1194,19 @@ Project: {query[:100]}
 Materials:
 {material_list}
 Generate procurement timeline in this exact structured Markdown format. Do not add extra text or notes outside the tables. Ensure tables are properly formatted with no empty rows:
-Output of Procurement Timeline:
-1. Electrical Equipment
-| Item | Lead Time | Order By | Delivery Window | Notes |
-|------|-----------|----------|-----------------|-------|
-| Transformers | 50 weeks | Feb 1, 2026 | Dec 2026 | Potential delays |
-
-2. Mechanical Equipment
-| Item | Lead Time | Order By | Delivery Window | Notes |
-|------|-----------|----------|-----------------|-------|
-| Cement | In-stock | Immediate | Immediate | Standard material |
-
-Use industry-standard lead times. Only include relevant items from materials.
+{TIMELINE_FORMAT}
 """
-    if len(prompt) > 3000:
-        prompt = prompt[:3000] + "\n... (truncated)"
+    prompt, truncated = truncate_to_tokens(prompt, MAX_PROMPT_TOKENS)
+    if truncated:
+        prompt += "\n... (truncated)"
     
     try:
-        headers = {
-            "Authorization": f"Bearer {groq_api_key}",
-            "Content-Type": "application/json"
-        }
         payload = {
-            "model": "llama-3.1-8b-instant",  # Updated to current supported model
+            "model": GROQ_MODEL,
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": 512
         }
-        response = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
+        data = await rag.achat_completion(payload)
         if 'choices' in data and len(data['choices']) > 0:
             return data['choices'][0]['message']['content']
         st.error("Invalid API response for timeline.")
@@ -722,7 +1215,7 @@ Use industry-standard lead times. Only include relevant items from materials.
         st.error(f"Timeline generation error: {str(e)}")
         return f"Error: {str(e)}"
 
-def generate_schedule(materials: List[Dict], query: str, groq_api_key: str) -> str:
+async def agenerate_schedule(rag: IndiaMART_RAG, materials: List[Dict], query: str) -> str:
     material_list = "\n".join([f"- {m['Material/Equipment']}: {m['Quantity']}" for m in materials[:1]])
     prompt = f"""
 Date: September 14, 2025
@@ -730,35 +1223,19 @@ Project: {query[:100]}
 Materials:
 {material_list}
 Generate construction schedule in this exact structured Markdown format. Do not add extra text or notes outside the tables. Ensure tables are properly formatted with no empty rows:
-Output of Integrated with Construction Project Schedule:
-WBS Level 2: 1. Design & Engineering
-| ID | Task | Duration | Start | Finish | Notes |
-|----|------|----------|-------|--------|-------|
-| 1.1 | Conceptual Design | 30 days | 01-Jan-2026 | 30-Jan-2026 | 30% Design |
-
-WBS Level 2: 2. Mech & Electrical Installations
-| ID | Task | Duration | Start | Finish | Notes |
-|----|------|----------|-------|--------|-------|
-| 2.1 | Transformer Installation | 15 days | 01-Dec-2026 | 15-Dec-2026 | |
-
-Use typical construction timelines. Only include relevant items from materials.
+{SCHEDULE_FORMAT}
 """
-    if len(prompt) > 3000:
-        prompt = prompt[:3000] + "\n... (truncated)"
+    prompt, truncated = truncate_to_tokens(prompt, MAX_PROMPT_TOKENS)
+    if truncated:
+        prompt += "\n... (truncated)"
     
     try:
-        headers = {
-            "Authorization": f"Bearer {groq_api_key}",
-            "Content-Type": "application/json"
-        }
         payload = {
-            "model": "llama-3.1-8b-instant",  # Updated to current supported model
+            "model": GROQ_MODEL,
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": 512
         }
-        response = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
+        data = await rag.achat_completion(payload)
         if 'choices' in data and len(data['choices']) > 0:
             return data['choices'][0]['message']['content']
         st.error("Invalid API response for schedule.")
@@ -767,10 +1244,86 @@ Use typical construction timelines. Only include relevant items from materials.
         st.error(f"Schedule generation error: {str(e)}")
         return f"Error: {str(e)}"
 
+async def agenerate_full_report(rag: IndiaMART_RAG, query: str, context: List[Dict[str, Any]],
+                                materials: List[Dict], on_update: Callable[[Dict[str, str]], None] = None) -> tuple:
+    """(answer, timeline, schedule) from one Groq call; any section missing from the reply is
+    regenerated with its single-purpose prompt. With on_update the reply is streamed, and the
+    sections received so far are passed to it as each line completes"""
+    prompt = f"""
+Date: September 14, 2025
+Assistant for construction procurement. Use context from IndiaMART database.
+Context:
+{rag._context_text(context, materials)}
+Project: {query}
+Write exactly three sections, in this order, each starting with its header line exactly as shown.
+
+### Products
+Use only context info. Be concise and factual. Output in structured format:
+{ANSWER_FORMAT}
+
+### Timeline
+Procurement timeline in this exact structured Markdown format. Do not add extra text or notes outside the tables. Ensure tables are properly formatted with no empty rows:
+{TIMELINE_FORMAT}
+
+### Schedule
+Construction schedule in this exact structured Markdown format. Do not add extra text or notes outside the tables. Ensure tables are properly formatted with no empty rows:
+{SCHEDULE_FORMAT}
+"""
+    prompt, truncated = truncate_to_tokens(prompt, REPORT_MAX_PROMPT_TOKENS)
+    if truncated:
+        prompt += "\n... (truncated)"
+    
+    # The prompt is the whole input, so identical prompts against the same index reuse the report
+    cache_key = (rag._index_version, 'report', hashlib.sha1(prompt.encode()).hexdigest())
+    cached = rag._recall(cache_key)
+    if cached is not None:
+        if on_update is not None:
+            on_update(dict(zip(('products', 'timeline', 'schedule'), cached)))
+        return cached
+    
+    sections = {}
+    try:
+        payload = {
+            "model": GROQ_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 1536,
+            "temperature": 0.7
+        }
+        if on_update is None:
+            data = await rag.achat_completion(payload)
+            if 'choices' in data and len(data['choices']) > 0:
+                sections = _split_report(data['choices'][0]['message']['content'])
+        else:
+            text = ""
+            async for delta in rag.astream_chat_completion(payload):
+                text += delta
+                if "\n" in delta:
+                    on_update(_split_report(text))
+            # Only a completed stream counts; a reply cut off mid-way is regenerated below
+            sections = _split_report(text)
+            on_update(sections)
+    except Exception as e:
+        st.error(f"Report generation error: {str(e)}")
+    
+    fallbacks = {}
+    if 'products' not in sections:
+        fallbacks['products'] = rag.agenerate_response(query, context, material_estimates=materials)
+    if 'timeline' not in sections:
+        fallbacks['timeline'] = agenerate_timeline(rag, materials, query)
+    if 'schedule' not in sections:
+        fallbacks['schedule'] = agenerate_schedule(rag, materials, query)
+    if fallbacks:
+        sections.update(zip(fallbacks, await asyncio.gather(*fallbacks.values())))
+    report = (sections['products'], sections['timeline'], sections['schedule'])
+    # Failed Groq calls come back as "Error: ..." text; retry those next time
+    if not any(text.startswith("Error:") for text in report):
+        rag._remember(cache_key, report)
+    return report
+
 def extract_vendor_details(answer: str) -> str:
     """Improved extraction of vendor details from RAG answer"""
     # Use regex to parse structured output from LLM
-    vendor_match = re.search(r'Vendors:\s*1\.\s*Company Name: (.*?)\s*Address: (.*?)\s*GST Status: (.*?)\s*Rating: (.*)', answer, re.DOTALL)
+    vendor_match = _VENDOR_RE.search(answer)
     if vendor_match:
         company = vendor_match.group(1).strip()
         address = vendor_match.group(2).strip()
@@ -799,38 +1352,28 @@ def plot_gantt_chart(schedule_text: str):
                 finish = parts[4]
                 tasks.append({'Section': current_section, 'Task': task, 'Start': start, 'Finish': finish, 'Duration': duration})
     
-    # Convert to dates (example parsing, assume format DD-MMM-YYYY)
-    start_dates = []
-    durations = []
-    task_names = []
-    for task in tasks:
-        try:
-            start_dt = pd.to_datetime(task['Start'], dayfirst=True)
-            finish_dt = pd.to_datetime(task['Finish'], dayfirst=True)
-            
-            if pd.isna(start_dt) or pd.isna(finish_dt):
-                continue
-                
-            start_date = start_dt.to_pydatetime()
-            finish_date = finish_dt.to_pydatetime()
-            
-            duration_days = (finish_date - start_date).days
-            start_dates.append(start_date)
-            durations.append(duration_days)
-            task_names.append(task['Task'])
-        except Exception as e:
-            # st.error(f"Date parsing error: {str(e)}")
-            pass
+    if not tasks:
+        return None
+    
+    # Parse every Start/Finish in one pass (format DD-MMM-YYYY expected); rows that fail to parse are dropped
+    task_df = pd.DataFrame(tasks)
+    starts = pd.to_datetime(task_df['Start'], dayfirst=True, format='mixed', errors='coerce')
+    finishes = pd.to_datetime(task_df['Finish'], dayfirst=True, format='mixed', errors='coerce')
+    mask = starts.notna() & finishes.notna()
+    
+    # Python datetimes keep the bar widths below in days on matplotlib's date axis
+    start_dates = list(starts[mask].dt.to_pydatetime())
+    durations = (finishes[mask] - starts[mask]).dt.days.tolist()
+    task_names = task_df.loc[mask, 'Task'].tolist()
     
     if not task_names:
         return None
     
     fig, ax = plt.subplots(figsize=(10, len(task_names) * 0.5))
     ax.barh(task_names, durations, left=start_dates, height=0.4, color='orange', label='Procurement')
-    # Add installation as blue
-    for i in range(len(durations)):
-        install_start = start_dates[i] + relativedelta(days=durations[i])
-        ax.barh(task_names[i], 30, left=install_start, height=0.4, color='blue', label='Installation' if i == 0 else "")
+    # Add installation as blue: 30-day bars starting where procurement ends, drawn in one call
+    install_starts = np.array(start_dates, dtype='datetime64[D]') + np.array(durations, dtype='timedelta64[D]')
+    ax.barh(task_names, 30, left=install_starts.astype(object), height=0.4, color='blue', label='Installation')
     
     ax.set_xlabel('Timeline')
     ax.set_title('Overlapping Gantt: Procurement vs Installation (All Equipment)')
@@ -838,78 +1381,149 @@ def plot_gantt_chart(schedule_text: str):
     plt.gca().invert_yaxis()
     return fig
 
+async def _gather_plan_inputs(rag: IndiaMART_RAG, query: str, materials: List[Dict[str, Any]]):
+    """Concurrently fetch the ML inputs and vendor answers for the estimated materials"""
+    vendor_queries = [f"Find suppliers for {m['Material/Equipment']} in Navi Mumbai with high ratings GST after 2017" for m in materials]
+    return await asyncio.gather(
+        agenerate_ml_inputs_batch(rag, query, [m['Material/Equipment'] for m in materials]),
+        rag.aquery_batch(vendor_queries, k=3),
+    )
+
+def _start_preload() -> SimpleNamespace:
+    """Build the RAG (encoder, documents, FAISS index) on a background thread, then run one search so the
+    encoder and index are warm before the first real query. The thread makes no Streamlit calls: its
+    status messages are queued in state.messages for main() to draw"""
+    state = SimpleNamespace(done=threading.Event(), rag=None, error=None, messages=[])
+    
+    def preload():
+        try:
+            rag = IndiaMART_RAG()
+            rag.status_messages = state.messages
+            rag.load_and_process_json_files()
+            rag.build_faiss_index()
+            rag.search(PRELOAD_WARMUP_QUERY, k=1)
+            state.rag = rag
+        except Exception as e:
+            state.error = e
+        finally:
+            state.done.set()
+    
+    threading.Thread(target=preload, daemon=True).start()
+    return state
+
 def main():
     st.title("Construction Procurement Assistant")
     st.write("Enter project details to get material estimates, vendor information, and schedules.")
     
-    if 'rag' not in st.session_state:
-        try:
-            st.session_state.rag = IndiaMART_RAG()
-            st.session_state.rag.load_and_process_json_files()
-            st.session_state.rag.build_faiss_index()
-        except Exception as e:
-            st.error(f"Initialization error: {str(e)}")
-            return
+    # Indexing starts with the first page load; the input widgets render while it runs
+    if 'preload' not in st.session_state:
+        st.session_state.preload = _start_preload()
     
     query = st.text_area("Enter Project Details",
                          placeholder="e.g., 25 MegaWatt, 2 Lacs SquareFoot Built Up Area, Project Volume of 1875 Cr in Rupees, Build in Navi Mumbai Area",
                          height=100)
+    generate = st.button("Generate Procurement Plan")
     
-    if st.button("Generate Procurement Plan"):
+    preload = st.session_state.preload
+    if not preload.done.is_set():
+        with st.spinner("Loading documents and building the search index..."):
+            preload.done.wait()
+    # Draw the loading messages once, on the first run after the preload finishes
+    while preload.messages:
+        level, message = preload.messages.pop(0)
+        getattr(st, level)(message)
+    if preload.rag is not None:
+        preload.rag.status_messages = None
+    if preload.error is not None:
+        st.error(f"Initialization error: {str(preload.error)}")
+        # Start over on the next run
+        del st.session_state.preload
+        return
+    st.session_state.rag = preload.rag
+    
+    if generate:
         if not query:
             st.error("Please enter project details.")
             return
         
         with st.spinner("Processing query..."):
             try:
-                result = st.session_state.rag.query(query)
+                rag = st.session_state.rag
+                requirements = rag.extract_project_requirements(query)
+                material_estimates = []
+                if any([requirements["power_capacity"], requirements["built_up_area"], requirements["project_volume"]]):
+                    material_estimates = rag.estimate_material_requirements(requirements)
                 
-                st.subheader("Query Results")
-                st.write(f"**Answer:**\n{result['answer']}")
+                # ML inputs and vendor lookups are independent: send them together
+                ml_inputs, vendor_results = rag.run(_gather_plan_inputs(rag, query, material_estimates[:3]))  # Limit to 3 to reduce API calls
                 
-                if result['sources']:
-                    st.subheader("Sources")
-                    for source in result['sources'][:3]:
-                        st.write(f"- {source}")
+                ml_messages = []
+                for mat, ml_input in zip(material_estimates[:3], ml_inputs):
+                    prediction = run_ml_prediction(ml_input)
+                    if 'error' not in prediction:
+                        mat['quantity'] = prediction['qty_shipped']
+                        format_material(mat)
+                        ml_messages.append((True, f"ML Prediction for {mat['Material/Equipment']}: Quantity updated to {mat['Quantity']}"))
+                    else:
+                        ml_messages.append((False, f"ML Error for {mat['Material/Equipment']}: {prediction['error']}"))
+                
+                # Lay the page out up front: the sections known now are drawn immediately, and the
+                # answer, timeline and schedule slots fill in while the report streams
+                st.subheader("Query Results")
+                answer_slot = st.empty()
+                sources_slot = st.container()
                 
-                material_estimates = result.get('material_estimates', [])
+                report_slots = {}
                 if material_estimates:
                     st.subheader("Prediction Model")
-                    for mat in material_estimates[:3]:  # Limit to 3 to reduce API calls
-                        ml_input = generate_ml_input(query, mat['Material/Equipment'], st.session_state.rag.groq_api_key)
-                        prediction = run_ml_prediction(ml_input)
-                        if 'error' not in prediction:
-                            qty = prediction['qty_shipped']
-                            parts = mat['Quantity'].split()
-                            if len(parts) > 1:
-                                parts[0] = str(qty)
-                                mat['Quantity'] = ' '.join(parts)
-                            st.write(f"ML Prediction for {mat['Material/Equipment']}: Quantity updated to {mat['Quantity']}")
+                    for ok, message in ml_messages:
+                        if ok:
+                            st.write(message)
                         else:
-                            st.error(f"ML Error for {mat['Material/Equipment']}: {prediction['error']}")
+                            st.error(message)
                     
                     st.write("\n**Material Estimates:**")
-                    st.markdown(st.session_state.rag.format_material_table(material_estimates))
+                    st.markdown(rag.format_material_table(material_estimates))
                     
                     st.subheader("Vendor Identification")
                     vendor_table = "| Material/Equipment | Quantity | Unit | Vendor/Manufacturers |\n|--------------------|----------|------|----------------------|\n"
-                    for mat in material_estimates[:3]:  # Limit to 3 to reduce API calls
-                        vendor_query = f"Find suppliers for {mat['Material/Equipment']} in Navi Mumbai with high ratings GST after 2017"
-                        try:
-                            vendor_result = st.session_state.rag.query(vendor_query, k=3)
+                    for mat, vendor_result in zip(material_estimates[:3], vendor_results):
+                        if isinstance(vendor_result, Exception):
+                            vendor = f"Error: {str(vendor_result)}"
+                        else:
                             vendor = extract_vendor_details(vendor_result['answer'])
-                        except Exception as e:
-                            vendor = f"Error: {str(e)}"
                         vendor_table += f"| {mat['Material/Equipment']} | {mat['Quantity']} | - | {vendor} |\n"
                     st.markdown(vendor_table)
                     
                     st.subheader("Procurement Timeline")
-                    timeline_text = generate_timeline(material_estimates, query, st.session_state.rag.groq_api_key)
-                    st.markdown(timeline_text)
+                    report_slots['timeline'] = st.empty()
                     
                     st.subheader("Integrated Project Schedule")
-                    schedule_text = generate_schedule(material_estimates, query, st.session_state.rag.groq_api_key)
-                    st.markdown(schedule_text)
+                    report_slots['schedule'] = st.empty()
+                
+                def show_report(sections):
+                    if 'products' in sections:
+                        answer_slot.write(f"**Answer:**\n{sections['products']}")
+                    for name, slot in report_slots.items():
+                        if name in sections:
+                            slot.markdown(sections[name])
+                
+                # Answer, timeline and schedule use the ML-updated quantities and come back from one call
+                result = rag.query(query, material_estimates=material_estimates, full_report=True,
+                                   on_report_update=show_report)
+                
+                answer_slot.write(f"**Answer:**\n{result['answer']}")
+                
+                if result['sources']:
+                    with sources_slot:
+                        st.subheader("Sources")
+                        for source in result['sources'][:3]:
+                            st.write(f"- {source}")
+                
+                if material_estimates:
+                    schedule_text = result['schedule']
+                    report_slots['timeline'].markdown(result['timeline'])
+                    report_slots['schedule'].markdown(schedule_text)
                     
                     # Generate and display Gantt chart
                     st.subheader("Overlapping Gantt: Procurement vs Installation (All Equipment)")
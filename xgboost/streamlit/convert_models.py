@@ -0,0 +1,22 @@
+import os
+import joblib
+import warnings
+
+warnings.filterwarnings('ignore')
+
+# Pickled XGBoost sklearn models that app.py prefers to load from a UBJSON copy
+MODELS = ['xgb_regressor_full', 'xgb_classifier_full']
+
+def main():
+    for name in MODELS:
+        pkl_path, ubj_path = f"{name}.pkl", f"{name}.ubj"
+        if not os.path.exists(pkl_path):
+            print(f"Skipping {name}: {pkl_path} not found")
+            continue
+        print(f"Converting {pkl_path} -> {ubj_path}...")
+        model = joblib.load(pkl_path)
+        model.save_model(ubj_path)
+    print("Done.")
+
+if __name__ == "__main__":
+    main()
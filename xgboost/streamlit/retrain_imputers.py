@@ -6,65 +6,46 @@ import warnings
 
 warnings.filterwarnings('ignore')
 
-def clean_numeric_value(value, clip_negative=True, replace_zero_epsilon=False):
-    """Clean a single numeric value"""
-    if isinstance(value, str):
-        value = (value.replace(',', '')
-                  .replace('$','')
-                  .replace(' ','')
-                  .replace(' ', ''))
-        try:
-            value = float(value)
-        except:
-            value = np.nan
+def clean_numeric_column(series, clip_negative=True, replace_zero_epsilon=False):
+    """Clean a whole numeric column; unparsable values come back as NaN"""
+    if series.dtype == object:
+        series = pd.to_numeric(series.astype(str).str.replace(r'[,$\s]', '', regex=True), errors='coerce')
+    values = series.to_numpy(dtype=float, na_value=np.nan)
     
-    if clip_negative and value is not None and value < 0:
-        value = 0
-    if replace_zero_epsilon and value is not None and value <= 0:
-        value = 0.01
+    if clip_negative:
+        values = np.where(values < 0, 0, values)
+    if replace_zero_epsilon:
+        values = np.where(values <= 0, 0.01, values)
     
-    return value
+    return values
+
+def _date_column(df, col):
+    """Parse a whole date column at once; a missing column is all NaT"""
+    if col not in df.columns:
+        return pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    # format='mixed' parses each value on its own, like the per-value to_datetime calls did
+    return pd.to_datetime(df[col], format='mixed', errors='coerce')
 
 def prepare_date_features(df, date_feature_names):
     """Prepare date features from dataframe"""
-    date_features_list = []
+    start_date = _date_column(df, 'CONSTRUCTION_START_DATE')
+    end_date = _date_column(df, 'SUBSTANTIAL_COMPLETION_DATE')
+    invoice_date = _date_column(df, 'invoiceDate')
     
-    for _, row in df.iterrows():
-        feats = {}
-        # Construction duration
-        try:
-            start_str = row.get('CONSTRUCTION_START_DATE', '')
-            end_str = row.get('SUBSTANTIAL_COMPLETION_DATE', '')
-            if pd.notna(start_str) and pd.notna(end_str):
-                start_date = pd.to_datetime(start_str, errors='coerce')
-                end_date = pd.to_datetime(end_str, errors='coerce')
-                if not pd.isna(start_date) and not pd.isna(end_date):
-                    duration = (end_date - start_date).days
-                    feats['construction_duration_days'] = duration
-        except:
-            pass
-            
-        # Invoice date features
-        try:
-            invoice_str = row.get('invoiceDate', '')
-            if pd.notna(invoice_str):
-                invoice_date = pd.to_datetime(invoice_str, errors='coerce')
-                if not pd.isna(invoice_date):
-                    feats['invoice_year'] = invoice_date.year
-                    feats['invoice_month'] = invoice_date.month
-                    feats['invoice_day'] = invoice_date.day
-                    feats['invoice_dayofweek'] = invoice_date.dayofweek
-                    feats['invoice_quarter'] = invoice_date.quarter
-        except:
-            pass
-            
-        # Fill row
-        row_data = []
-        for feature in date_feature_names:
-            row_data.append(feats.get(feature, np.nan))
-        date_features_list.append(row_data)
-        
-    return np.array(date_features_list)
+    # NaT propagates to NaN, so an unparsable or missing date leaves its features for the imputer
+    feats = {
+        'construction_duration_days': (end_date - start_date).dt.days,
+        'invoice_year': invoice_date.dt.year,
+        'invoice_month': invoice_date.dt.month,
+        'invoice_day': invoice_date.dt.day,
+        'invoice_dayofweek': invoice_date.dt.dayofweek,
+        'invoice_quarter': invoice_date.dt.quarter,
+    }
+    missing = np.full(len(df), np.nan)
+    return np.column_stack([
+        feats[feature].to_numpy(dtype=float, na_value=np.nan) if feature in feats else missing
+        for feature in date_feature_names
+    ])
 
 def main():
     print("Loading data...")
@@ -74,19 +55,14 @@ def main():
     print("\nRetraining Numeric Imputer...")
     numeric_features = ['ExtendedQuantity', 'UnitPrice', 'ExtendedPrice', 'invoiceTotal']
     
-    # Extract and clean numeric values
-    numeric_data = []
-    for _, row in df.iterrows():
-        row_vals = []
-        for feat in numeric_features:
-            val = row.get(feat, 0)
-            cleaned = clean_numeric_value(val, replace_zero_epsilon=(feat in ['UnitPrice', 'ExtendedPrice']))
-            if cleaned is None or np.isnan(cleaned):
-                cleaned = 0
-            row_vals.append(cleaned)
-        numeric_data.append(row_vals)
-    
-    numeric_data = np.array(numeric_data)
+    # Extract and clean numeric values, a whole column at a time
+    numeric_data = np.column_stack([
+        clean_numeric_column(df[feat] if feat in df.columns else pd.Series(0.0, index=df.index),
+                             replace_zero_epsilon=(feat in ['UnitPrice', 'ExtendedPrice']))
+        for feat in numeric_features
+    ])
+    # Unparsable values become 0 after the clip/epsilon step, as they did per row
+    numeric_data[np.isnan(numeric_data)] = 0
     
     # Apply log1p (as done in run.py)
     # Note: run.py does: numeric_values = [np.log1p(x) if x >= 0 else 0 for x in numeric_values]
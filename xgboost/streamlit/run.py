@@ -4,6 +4,7 @@ import joblib
 from datetime import datetime
 import warnings
 import os
+import re
 import traceback
 from scipy import sparse
 warnings.filterwarnings('ignore')
@@ -47,6 +48,9 @@ def clean_numeric_value(value, clip_negative=True, replace_zero_epsilon=False):
     
     return value
 
+# Anything that is neither alphanumeric nor whitespace (\w minus '_' is exactly str.isalnum)
+_NON_ALNUM_RE = re.compile(r'[^\w\s]|_')
+
 def clean_text_value(text):
     """Clean a single text value"""
     if pd.isna(text) or text is None:
@@ -54,7 +58,7 @@ def clean_text_value(text):
     
     text = str(text).strip().lower()
     text = text.replace('\n', ' ').replace('\r', ' ')
-    text = ''.join([c if c.isalnum() or c.isspace() else ' ' for c in text])
+    text = _NON_ALNUM_RE.sub(' ', text)
     text = ' '.join(text.split())  # Remove extra spaces
     
     return text
@@ -92,20 +96,29 @@ def prepare_date_features(input_data, date_feature_names):
         except:
             pass
     
-    # Create DataFrame with all expected columns
-    date_df = pd.DataFrame(columns=date_feature_names)
-    
-    # Fill in available values
-    for feature in date_feature_names:
-        if feature in date_features:
-            date_df[feature] = [date_features[feature]]
-        else:
-            date_df[feature] = [np.nan]
+    # One float row in date_feature_names order; features not computed stay NaN for the imputer
+    positions = {name: i for i, name in enumerate(date_feature_names)}
+    row = np.full((1, len(date_feature_names)), np.nan)
+    for feature, value in date_features.items():
+        if feature in positions:
+            row[0, positions[feature]] = value
     
-    return date_df
+    return row
+
+def impute_row(imputer, row):
+    """imputer.transform, skipped when the row has nothing to fill"""
+    row = np.asarray(row, dtype=np.float64).reshape(1, -1)
+    # SimpleImputer drops columns that were all-NaN at fit time (NaN statistic); only skip when it keeps them all
+    if not np.isnan(row).any() and not np.isnan(getattr(imputer, 'statistics_', np.nan)).any():
+        return row
+    return imputer.transform(row)
+
+def build_category_index(categorical_mapping):
+    """{column: {category: one-hot position}} so featurization is a dict lookup per column"""
+    return {c: {cat: i for i, cat in enumerate(top_categories)} for c, top_categories in categorical_mapping.items()}
 
 def prepare_features(input_data, tfidf_vectorizer, numeric_imputer, date_imputer, 
-                    categorical_mapping, date_feature_names):
+                    categorical_mapping, date_feature_names, category_index=None):
     """Prepare features in the same way as during training"""
     # 1. Text features (TF-IDF)
     cleaned_desc = clean_text_value(input_data.get('ItemDescription', ''))
@@ -124,42 +137,31 @@ def prepare_features(input_data, tfidf_vectorizer, numeric_imputer, date_imputer
     
     # Apply log1p transformation
     numeric_values = [np.log1p(x) if x >= 0 else 0 for x in numeric_values]
-    X_numeric = numeric_imputer.transform([numeric_values])
+    X_numeric = impute_row(numeric_imputer, numeric_values)
     
     # 3. Date features
-    date_df = prepare_date_features(input_data, date_feature_names)
-    X_date = date_imputer.transform(date_df)
+    X_date = impute_row(date_imputer, prepare_date_features(input_data, date_feature_names))
     
     # 4. Categorical features
     cat_cols = ['PROJECT_CITY', 'STATE', 'PROJECT_COUNTRY', 'CORE_MARKET', 'PROJECT_TYPE', 'UOM']
-    cat_features = []
+    if category_index is None:
+        category_index = build_category_index(categorical_mapping)
+    # Columns without a mapping are skipped; each mapped one gets its top categories plus an "other" slot
+    X_categorical = np.zeros((1, sum(len(category_index[c]) + 1 for c in cat_cols if c in category_index)),
+                             dtype=np.float32)
+    offset = 0
     
     for c in cat_cols:
         value = str(input_data.get(c, 'missing')).lower().strip()
-        if c in categorical_mapping:
-            top_categories = categorical_mapping[c]
-            # Create one-hot encoding
-            if value in top_categories:
-                # This value is in top categories
-                cat_features.extend([1 if value == cat else 0 for cat in top_categories])
-                cat_features.append(0)  # not "other"
-            else:
-                # This value is "other"
-                cat_features.extend([0] * len(top_categories))
-                cat_features.append(1)
-        else:
-            # No mapping available, skip this feature
-            pass
-    
-    X_categorical = np.array([cat_features])
+        if c in category_index:
+            positions = category_index[c]
+            X_categorical[0, offset + positions.get(value, len(positions))] = 1
+            offset += len(positions) + 1
     
-    # Combine all features
-    X_combined = sparse.hstack([
-        X_text,
-        sparse.csr_matrix(X_numeric),
-        sparse.csr_matrix(X_date),
-        sparse.csr_matrix(X_categorical)
-    ]).tocsr()
+    # Combine all features: the numeric, date and one-hot parts are joined densely first, so only
+    # one small CSR block is built and stacked beside the TF-IDF row
+    X_dense = np.concatenate([np.ravel(X_numeric), np.ravel(X_date), np.ravel(X_categorical)])
+    X_combined = sparse.hstack([X_text, sparse.csr_matrix(X_dense.reshape(1, -1))], format='csr')
     
     return X_combined
 
@@ -288,9 +290,8 @@ def main():
             prediction_method = "deterministic"
         elif classification_available:
             try:
-                # Convert to dense for XGBoost
-                X_dense = X_features.toarray()
-                pred_encoded = xgb_classifier.predict(X_dense)
+                # CSR goes straight to XGBoost's sparse predictor (the models were trained on CSR too)
+                pred_encoded = xgb_classifier.predict(X_features)
                 pred_processed = label_encoder.inverse_transform(pred_encoded)
                 master_item_no = class_mapping.get(pred_processed[0], 'unknown')
                 print(f"Using classification model prediction")
@@ -307,9 +308,7 @@ def main():
         # Regression prediction
         if regression_available:
             try:
-                # Convert to dense for XGBoost
-                X_dense = X_features.toarray()
-                qty_shipped = xgb_regressor.predict(X_dense)[0]
+                qty_shipped = xgb_regressor.predict(X_features)[0]
                 qty_shipped = max(1, int(qty_shipped))
                 print(f"Predicted quantity using regression model: {qty_shipped}")
             except Exception as e: